@@ -0,0 +1,144 @@
+## bytes per NPC
+"""Measure what one NPC costs in memory, empty and after some talking.
+
+    python -m benchmarks.memory --npcs 2000 --turns 5
+
+Allocations are counted with tracemalloc while NPCs are created and
+talked to, so everything they keep is included and everything shared
+(gateway, cache, world definition) is not. The breakdown walks one NPC's
+attributes to show where its bytes go.
+
+The figures are an absolute footprint for the current tree, not a
+comparison; no baseline ships with the repo. To check a change for
+growth, record benchmarks.run results (they include these figures as
+npc_memory) before the change and pass that file as --baseline after.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import sys
+import tracemalloc
+import types
+from typing import Dict, Iterable, List, Optional, Set
+
+import httpx
+
+from benchmarks.mock_llm import MockChatClient, MockLLM, mock_transport
+from src.game.game import NPC
+from src.llm.cache import ResponseCache
+from src.llm.gateway import LLMGateway
+
+PLAYERS = ("Traveler", "Aria", "Bram")
+# Objects that belong to nobody in particular
+SKIP = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType)
+
+
+def deep_size(obj, seen: Optional[Set[int]] = None) -> int:
+    """sys.getsizeof of obj and everything it references, each object once;
+    ids already in `seen` (shared objects) are not counted"""
+    seen = set() if seen is None else seen
+    size = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, SKIP):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        stack.extend(gc.get_referents(item))
+    return size
+
+
+def fields(obj) -> Iterable[str]:
+    """Instance attribute names, whether in __dict__ or __slots__"""
+    names = list(getattr(obj, "__dict__", {}))
+    for cls in type(obj).__mro__:
+        names.extend(getattr(cls, "__slots__", ()))
+    return [name for name in dict.fromkeys(names) if hasattr(obj, name)]
+
+
+def breakdown(npc: NPC, shared: Iterable) -> Dict[str, int]:
+    """Bytes per NPC attribute, counting shared objects as free"""
+    seen = {id(obj) for obj in shared}
+    sizes = {"self": sys.getsizeof(npc)}
+    seen.add(id(npc))
+    for name in fields(npc):
+        value = getattr(npc, name)
+        for attr in fields(value) if not isinstance(value, SKIP) else ():
+            # Back-references to the shared gateway hide behind bound methods
+            if getattr(value, attr, None) in shared:
+                seen.add(id(getattr(value, attr)))
+        sizes[name] = deep_size(value, seen)
+    return sizes
+
+
+def make_npcs(gateway: LLMGateway, cache: ResponseCache, count: int) -> List[NPC]:
+    npcs = []
+    for i in range(count):
+        npc = NPC(
+            f"Npc{i}",
+            "tavern keeper" if i % 2 else "guard",
+            "friendly but gossipy, loves to share local rumors",
+            "tavern",
+            llm=gateway,
+            cache=cache,
+        )
+        npc.episodes.disabled = True  # Vectors are packed float32 already
+        npcs.append(npc)
+    return npcs
+
+
+async def chat(npcs: List[NPC], turns: int):
+    for i, npc in enumerate(npcs):
+        for turn in range(turns):
+            player = PLAYERS[(i + turn) % len(PLAYERS)]
+            await npc.talk(
+                f"What news from the road, friend? ({turn})",
+                player,
+                reply=f"The north road is muddy again, {player}. Mind the ruts. ({i})",
+            )
+
+
+def measure(count: int, turns: int) -> Dict:
+    llm = MockLLM()
+    gateway = LLMGateway(
+        client=MockChatClient(llm),
+        http=httpx.AsyncClient(transport=mock_transport(llm)),
+    )
+    cache = ResponseCache()
+    make_npcs(gateway, cache, 1)  # Warm up class and module level state
+    gc.collect()
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    npcs = make_npcs(gateway, cache, count)
+    gc.collect()
+    spawned = tracemalloc.get_traced_memory()[0]
+    asyncio.run(chat(npcs, turns))
+    gc.collect()
+    talked = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    results = {
+        "npcs": count,
+        "turns": turns,
+        "bytes_per_npc": round((spawned - base) / count),
+        "bytes_per_npc_after_turns": round((talked - base) / count),
+        "breakdown": breakdown(npcs[-1], (gateway, cache)),
+    }
+    gateway.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory used per NPC")
+    parser.add_argument("--npcs", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=5, help="exchanges per NPC")
+    args = parser.parse_args()
+    print(json.dumps(measure(args.npcs, args.turns), indent=2))
+
+
+if __name__ == "__main__":
+    main()
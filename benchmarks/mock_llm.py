@@ -0,0 +1,165 @@
+## deterministic stand-in for Ollama and the /generate server
+import argparse
+import asyncio
+import json
+import random
+import zlib
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+WORDS = (
+    "the ale is warm tonight and the road north is muddy after rain "
+    "travelers say the king has doubled the guard at the castle gates "
+    "old tom sells rope and torches at a fair price if you ask kindly"
+).split()
+
+
+class MockLLM:
+    """Replies that depend only on the prompt, streamed at a fixed pace.
+
+    Each reply starts with `think_words` words of deepseek-r1 style
+    <think> reasoning, then `reply_words` words in sentences of about eight
+    words. The first token arrives after `latency` seconds and the rest at
+    `tokens_per_second`, so timings are repeatable between runs.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        tokens_per_second: float = 200.0,
+        reply_words: int = 40,
+        think_words: int = 20,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.reply_words = reply_words
+        self.think_words = think_words
+        self.seed = seed
+        self.requests = 0
+        self.tokens = 0
+
+    def tokens_for(self, prompt: str) -> List[str]:
+        rng = random.Random(zlib.crc32(prompt.encode("utf-8")) ^ self.seed)
+        words = [rng.choice(WORDS) for _ in range(self.reply_words)]
+        reply = []
+        for index, word in enumerate(words):
+            end = "." if index % 8 == 7 or index == len(words) - 1 else ""
+            reply.append((word.capitalize() if index % 8 == 0 else word) + end + " ")
+
+        thinking = [rng.choice(WORDS) + " " for _ in range(self.think_words)]
+        if thinking:
+            thinking = ["<think>"] + thinking + ["</think>\n\n"]
+        return thinking + reply
+
+    def complete(self, prompt: str) -> str:
+        self.requests += 1
+        return "".join(self.tokens_for(prompt))
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        delay = 1 / self.tokens_per_second if self.tokens_per_second else 0
+        for token in self.tokens_for(prompt):
+            self.tokens += 1
+            yield token
+            await asyncio.sleep(delay)
+
+
+class MockChatClient:
+    """The subset of ollama.AsyncClient that the gateway uses"""
+
+    def __init__(self, llm: Optional[MockLLM] = None):
+        self.llm = llm or MockLLM()
+
+    async def chat(
+        self, model, messages, options=None, keep_alive=None, stream=False, **kwargs
+    ):
+        prompt = "\n".join(message["content"] for message in messages)
+        if not stream:
+            await asyncio.sleep(self.llm.latency)
+            content = self.llm.complete(prompt)
+            return {
+                "model": model,
+                "message": {"role": "assistant", "content": content},
+            }
+        return self._parts(model, prompt)
+
+    async def _parts(self, model, prompt) -> AsyncIterator[Dict]:
+        async for token in self.llm.stream(prompt):
+            yield {
+                "model": model,
+                "message": {"role": "assistant", "content": token},
+                "done": False,
+            }
+
+    async def generate(self, model, prompt="", keep_alive=None, **kwargs):
+        return {"model": model, "response": ""}
+
+    async def embed(self, model, input, **kwargs):
+        # Bag-of-words hashing: similar prompts get similar vectors
+        vector = [0.0] * 64
+        for word in str(input).lower().split():
+            vector[zlib.crc32(word.encode("utf-8")) % 64] += 1.0
+        return {"model": model, "embeddings": [vector]}
+
+    async def close(self):
+        pass
+
+
+def mock_transport(llm: Optional[MockLLM] = None) -> httpx.MockTransport:
+    """In-process /generate endpoint for an httpx.AsyncClient"""
+    llm = llm or MockLLM()
+
+    async def handle(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        if body.get("stream"):
+            chunks = (
+                token.encode("utf-8") async for token in llm.stream(body["prompt"])
+            )
+            return httpx.Response(200, content=chunks)
+        await asyncio.sleep(llm.latency)
+        return httpx.Response(200, json={"response": llm.complete(body["prompt"])})
+
+    return httpx.MockTransport(handle)
+
+
+def create_app(llm: Optional[MockLLM] = None):
+    """FastAPI app with the same /generate contract as main.py"""
+    from fastapi import FastAPI
+    from fastapi.responses import StreamingResponse
+    from pydantic import BaseModel
+
+    llm = llm or MockLLM()
+    app = FastAPI()
+
+    class GenerateRequest(BaseModel):
+        prompt: str
+        stream: bool = False
+
+    @app.post("/generate")
+    async def generate(request: GenerateRequest):
+        if request.stream:
+            return StreamingResponse(
+                llm.stream(request.prompt), media_type="text/plain; charset=utf-8"
+            )
+        await asyncio.sleep(llm.latency)
+        return {"response": llm.complete(request.prompt)}
+
+    return app
+
+
+if __name__ == "__main__":
+    # Stand-in for main.py, e.g. to play game.py without a GPU
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Mock /generate server")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tps", type=float, default=200.0, help="tokens per second")
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(MockLLM(args.latency, args.tps)), host="127.0.0.1", port=args.port
+    )
@@ -0,0 +1,322 @@
+## dialogue round-trip benchmarks
+"""Measure the dialogue path against a local mock LLM.
+
+    python -m benchmarks.run --out results.json        # before a change
+    python -m benchmarks.run --baseline results.json   # after; fail on regressions
+
+Nothing here needs Ollama or a network; the mock is deterministic, so
+differences between runs come from the code, not the model. Baselines
+are not kept in the repo: timings only compare on the same machine, so
+record one locally before the change being measured.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import httpx
+
+from benchmarks import memory
+from benchmarks.mock_llm import MockChatClient, MockLLM, mock_transport
+from src.game.game import NPC
+from src.llm.cache import ResponseCache
+from src.llm.gateway import LLMGateway
+
+Summary = Dict[str, float]
+
+
+def summarize(samples: List[float]) -> Summary:
+    """Milliseconds: count, mean, median, p95 and worst case"""
+    ms = sorted(s * 1000 for s in samples)
+    return {
+        "n": len(ms),
+        "mean": round(statistics.fmean(ms), 3),
+        "p50": round(ms[len(ms) // 2], 3),
+        "p95": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+        "max": round(ms[-1], 3),
+    }
+
+
+def make_gateway(llm: MockLLM, concurrency: int) -> LLMGateway:
+    return LLMGateway(
+        client=MockChatClient(llm),
+        http=httpx.AsyncClient(transport=mock_transport(llm)),
+        max_concurrency=concurrency,
+    )
+
+
+def make_npc(gateway: LLMGateway, index: int = 0) -> NPC:
+    return NPC(
+        f"Npc{index}",
+        "tavern keeper",
+        "friendly but gossipy, loves to share local rumors",
+        "tavern",
+        llm=gateway,
+        cache=ResponseCache(),
+    )
+
+
+async def timed_turn(talk) -> Dict[str, float]:
+    """Run talk(on_token) and time the first visible token and the whole turn"""
+    start = time.perf_counter()
+    first = None
+
+    def on_token(chunk):
+        nonlocal first
+        if first is None:
+            first = time.perf_counter()
+
+    await talk(on_token)
+    end = time.perf_counter()
+    return {"ttft": (first or end) - start, "turn": end - start}
+
+
+def bench_prompt_build(gateway: LLMGateway, iterations: int) -> Dict[str, Summary]:
+    """Prompt assembly with a full memory, for both front ends"""
+    npc = make_npc(gateway)
+    for turn in range(npc.memory.max_turns):
+        npc.memory.add("user" if turn % 2 == 0 else "assistant", f"line {turn} " * 20)
+
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        npc.prompt.build_messages(npc.memory.messages(), f"Traveler: question {i}")
+        samples.append(time.perf_counter() - start)
+    results = {"cli": summarize(samples)}
+
+    game = make_game(gateway)
+    history = game.history("tavern_keeper")
+    for turn in range(history.max_turns):
+        history.add("user" if turn % 2 == 0 else "assistant", f"line {turn} " * 20)
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        game.build_npc_context("tavern_keeper", f"question {i}")
+        samples.append(time.perf_counter() - start)
+    results["pygame"] = summarize(samples)
+    return results
+
+
+async def bench_turns(gateway: LLMGateway, turns: int) -> Dict[str, Dict]:
+    """Time to first token and full turn latency, one conversation at a time"""
+    npc = make_npc(gateway)
+    cli = [
+        await timed_turn(lambda on_token: npc.talk(f"question {i}", on_token=on_token))
+        for i in range(turns)
+    ]
+
+    game = make_game(gateway)
+    pygame_turns = []
+    for i in range(turns):
+        message = f"question {i}"
+        prompt = game.build_npc_context("tavern_keeper", message)
+        pygame_turns.append(
+            await timed_turn(
+                lambda on_token: game.fetch_reply(
+                    prompt, "tavern_keeper", message, on_token=on_token
+                )
+            )
+        )
+
+    return {
+        "ttft": {
+            "cli": summarize([t["ttft"] for t in cli]),
+            "pygame": summarize([t["ttft"] for t in pygame_turns]),
+        },
+        "turn": {
+            "cli": summarize([t["turn"] for t in cli]),
+            "pygame": summarize([t["turn"] for t in pygame_turns]),
+        },
+    }
+
+
+async def bench_throughput(
+    gateway: LLMGateway, llm: MockLLM, npc_counts: List[int]
+) -> Dict[str, Dict]:
+    """N NPCs answering at once: replies and tokens per second"""
+    results = {}
+    for count in npc_counts:
+        npcs = [make_npc(gateway, i) for i in range(count)]
+        tokens = llm.tokens
+        start = time.perf_counter()
+        turns = await asyncio.gather(
+            *(
+                timed_turn(
+                    lambda on_token, npc=npc: npc.talk("what news?", on_token=on_token)
+                )
+                for npc in npcs
+            )
+        )
+        elapsed = time.perf_counter() - start
+        results[str(count)] = {
+            "replies_per_s": round(count / elapsed, 3),
+            "tokens_per_s": round((llm.tokens - tokens) / elapsed, 3),
+            "turn": summarize([t["turn"] for t in turns]),
+        }
+    return results
+
+
+def bench_render(gateway: LLMGateway, frames: int) -> Dict[str, Summary]:
+    """Headless frame times while walking and while a reply streams in"""
+    import game as village
+
+    game = make_game(gateway)
+    walk = village.random_walk(seed=0)
+    samples = []
+    for tick in range(frames):
+        game.update(village.TICK, walk(tick))
+        start = time.perf_counter()
+        game.draw()
+        samples.append(time.perf_counter() - start)
+    results = {"explore": summarize(samples)}
+
+    game.dialogue.start_conversation("tavern_keeper", "")
+    game.game_state = village.GameState.TALKING
+    tokens = MockLLM(reply_words=120).tokens_for("render")
+    text = ""
+    samples = []
+    for tick in range(frames):
+        if tick < len(tokens):
+            text += tokens[tick]
+            game.dialogue.set_npc_response(text)
+        start = time.perf_counter()
+        game.draw()
+        samples.append(time.perf_counter() - start)
+    results["dialogue"] = summarize(samples)
+    return results
+
+
+def bench_crowd(sizes: List[int], ticks: int) -> Dict[str, Summary]:
+    """Crowd.step() time for villages of each size, player in the middle"""
+    from game import SCREEN_HEIGHT, SCREEN_WIDTH, TICK, GameConfig
+    from src.game.crowd import Crowd
+
+    results = {}
+    for size in sizes:
+        crowd = Crowd(
+            GameConfig.WORLD, (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT - 50), extras=size
+        )
+        samples = []
+        for _ in range(ticks):
+            start = time.perf_counter()
+            crowd.step(TICK, (SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2))
+            samples.append(time.perf_counter() - start)
+        results[str(size)] = summarize(samples)
+    return results
+
+
+def make_game(gateway: LLMGateway):
+    import game as village
+
+    return village.LLMGame(
+        headless=True, save_path=None, llm=gateway, cache=ResponseCache()
+    )
+
+
+def flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    """Comparable leaves: medians, p95s, rates and bytes per NPC"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif key in ("p50", "p95") or key.endswith("_per_s"):
+            flat[name] = value
+        elif key.startswith("bytes_per_npc"):
+            flat[name] = value
+    return flat
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Metrics that got worse than the baseline by more than threshold"""
+    regressions = []
+    current = flatten(results)
+    for name, before in flatten(baseline).items():
+        after = current.get(name)
+        if after is None or not before:
+            continue
+        change = (after - before) / before
+        if name.endswith("_per_s"):
+            change = -change  # Higher is better
+        if change > threshold:
+            regressions.append(f"{name}: {before} -> {after} ({change:+.0%})")
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dialogue round-trip benchmarks")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tps", type=float, default=200.0, help="mock tokens/s")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--npcs", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--crowd", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--population", type=int, default=1000, help="NPCs to weigh")
+    args = parser.parse_args()
+
+    llm = MockLLM(latency=args.latency, tokens_per_second=args.tps)
+    gateway = make_gateway(llm, args.concurrency)
+    try:
+        results = {"prompt_build": bench_prompt_build(gateway, args.iterations)}
+        results.update(asyncio.run(bench_turns(gateway, args.turns)))
+        results["throughput"] = asyncio.run(bench_throughput(gateway, llm, args.npcs))
+        results["frame"] = bench_render(gateway, args.frames)
+        results["crowd_tick"] = bench_crowd(args.crowd, args.frames)
+        results["npc_memory"] = memory.measure(args.population, turns=5)
+    finally:
+        gateway.close()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,38 @@
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import queue
+import random
 import sys
-import threading
+import time
 from enum import Enum
 
+import numpy as np
 import pygame
-import requests
 
-# Initialize Pygame
-pygame.init()
+from src.game.crowd import Crowd
+from src.game.render import DirtyRenderer, LayoutCache, Sprite, TextCache
+from src.game.save import SaveStore
+from src.game.spatial import SpatialGrid
+from src.game.world import DEFAULT_WORLD, load_world
+from src.llm.cache import get_cache, is_cacheable
+from src.llm.gateway import get_gateway
+from src.llm.memory import ConversationMemory
+from src.llm.postprocess import ReplyFilter
+from src.llm.prefetch import Prefetcher
+from src.llm.prompt import PromptBuilder
+from src.llm.router import get_router
+from src.llm.scheduler import PLAYER, PREFETCH
+from src.perf import get_metrics, timed
 
 # Constants
 SCREEN_WIDTH = 1000
 SCREEN_HEIGHT = 700
 FPS = 60
+TICK = 1 / 60  # Fixed simulation timestep in seconds
+MAX_FRAME_TIME = 0.25  # Don't try to catch up on more than this after a stall
 
 # Colors
 BLACK = (0, 0, 0)
@@ -36,76 +57,25 @@ class GameConfig:
     """Game configuration and parameters"""
 
     API_URL = "http://127.0.0.1:8000/generate"
+    GREETING = "*walks up to you*"
 
-    WORLD_CONTEXT = """You are an NPC in a fantasy village. You have your own personality,
-    memories, and goals. Respond naturally to the player's actions and questions.
-    Keep responses under 80 words and be conversational."""
-
-    # Location definitions with coordinates
-    LOCATIONS = {
-        "town_center": {
-            "rect": pygame.Rect(400, 300, 200, 100),
-            "color": LIGHT_GRAY,
-            "name": "Town Center",
-        },
-        "market": {
-            "rect": pygame.Rect(100, 200, 150, 120),
-            "color": YELLOW,
-            "name": "Market",
-        },
-        "tavern": {
-            "rect": pygame.Rect(650, 150, 180, 140),
-            "color": BROWN,
-            "name": "Tavern",
-        },
-        "guard_post": {
-            "rect": pygame.Rect(750, 450, 120, 100),
-            "color": GRAY,
-            "name": "Guard Post",
-        },
-    }
-
-    # NPCs with positions and properties
-    NPCS = {
-        "merchant": {
-            "name": "Old Tom",
-            "personality": "A grumpy but fair merchant who sells potions and supplies.",
-            "location": "market",
-            "pos": (175, 250),
-            "color": GREEN,
-            "inventory": ["health potion", "magic scroll", "rope", "torch"],
-        },
-        "guard": {
-            "name": "Captain Sarah",
-            "personality": "A serious town guard who takes her duty seriously.",
-            "location": "guard_post",
-            "pos": (810, 500),
-            "color": BLUE,
-            "mood": "suspicious",
-        },
-        "tavern_keeper": {
-            "name": "Merry Bob",
-            "personality": "A cheerful tavern keeper who loves gossip and stories.",
-            "location": "tavern",
-            "pos": (740, 220),
-            "color": RED,
-            "special": "knows local rumors",
-        },
-    }
+    # Locations and NPCs, shared with the text adventure
+    WORLD = load_world(os.environ.get("VILLAGE_WORLD", DEFAULT_WORLD))
 
 
 class Player:
-    def __init__(self, x, y):
+    def __init__(self, x, y, spatial):
         self.x = x
         self.y = y
-        self.speed = 3
+        self.speed = 180  # Pixels per second
         self.radius = 15
         self.inventory = ["rusty sword", "5 gold coins"]
         self.current_location = "town_center"
+        self.spatial = spatial  # Index of locations and NPCs
 
-    def move(self, dx, dy):
-        self.x += dx * self.speed
-        self.y += dy * self.speed
+    def move(self, dx, dy, dt=TICK):
+        self.x += dx * self.speed * dt
+        self.y += dy * self.speed * dt
 
         # Keep player on screen
         self.x = max(self.radius, min(SCREEN_WIDTH - self.radius, self.x))
@@ -117,22 +87,107 @@ class Player:
         self.update_location()
 
     def update_location(self):
-        player_rect = pygame.Rect(
-            self.x - self.radius, self.y - self.radius, self.radius * 2, self.radius * 2
+        player_rect = (
+            self.x - self.radius,
+            self.y - self.radius,
+            self.radius * 2,
+            self.radius * 2,
         )
 
-        for loc_name, loc_data in GameConfig.LOCATIONS.items():
-            if player_rect.colliderect(loc_data["rect"]):
-                self.current_location = loc_name
-                return
+        locations = self.spatial.query_rect(player_rect)
+        self.current_location = locations[0] if locations else "wilderness"
+
+    def state(self):
+        return {"x": self.x, "y": self.y, "inventory": list(self.inventory)}
 
-        self.current_location = "wilderness"
+    def restore(self, state):
+        self.x = state.get("x", self.x)
+        self.y = state.get("y", self.y)
+        self.inventory = list(state.get("inventory", self.inventory))
+        self.update_location()
+
+    def apply(self, event):
+        if "inventory" in event:
+            self.inventory = list(event["inventory"])
+
+    def rect(self):
+        """Screen area covered by the player, including the outline"""
+        return pygame.Rect(
+            int(self.x) - self.radius - 1,
+            int(self.y) - self.radius - 1,
+            self.radius * 2 + 3,
+            self.radius * 2 + 3,
+        )
 
     def draw(self, screen):
         pygame.draw.circle(screen, WHITE, (int(self.x), int(self.y)), self.radius)
         pygame.draw.circle(screen, BLACK, (int(self.x), int(self.y)), self.radius, 2)
 
 
+class VillageSim:
+    """World state and rules without any pygame display, fonts or input.
+
+    Advances in fixed timesteps, so it can run headless on a server, replay
+    recorded input, or run many independent worlds in one process.
+    """
+
+    def __init__(self, crowd=None):
+        # Spatial index of locations and NPCs
+        self.spatial = SpatialGrid()
+        for loc in GameConfig.WORLD.locations.values():
+            if loc.rect is not None:
+                self.spatial.insert_rect(loc.id, loc.rect)
+        for npc in GameConfig.WORLD.npcs.values():
+            if npc.pos is not None:
+                self.spatial.insert_point(npc.id, *npc.pos)
+
+        # Named NPCs plus any number of anonymous villagers, moved in bulk
+        if crowd is None:
+            crowd = int(os.environ.get("VILLAGE_CROWD", "0"))
+        self.crowd = Crowd(
+            GameConfig.WORLD, (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT - 50), extras=crowd
+        )
+        self.talking = None  # NPC that stands still for a conversation
+
+        self.player = Player(500, 350, self.spatial)
+        self.ticks = 0
+        self.time = 0.0
+
+    def step(self, dx=0, dy=0, dt=TICK):
+        """Advance the world by one fixed timestep"""
+        if dx != 0 or dy != 0:
+            self.player.move(dx, dy, dt)
+
+        crowd = self.crowd
+        crowd.hold(self.talking)
+        crowd.step(dt, (self.player.x, self.player.y))
+        for row, key in enumerate(crowd.keys):
+            self.spatial.move_point(key, *crowd.pos[row].tolist())
+
+        self.ticks += 1
+        self.time += dt
+
+    def run(self, ticks, inputs=None, dt=TICK):
+        """Run as fast as possible; inputs(tick) returns (dx, dy)"""
+        for _ in range(ticks):
+            dx, dy = inputs(self.ticks) if inputs else (0, 0)
+            self.step(dx, dy, dt)
+
+
+def random_walk(seed=0, hold=30):
+    """Input source for soak tests: a new random direction every `hold` ticks"""
+    rng = random.Random(seed)
+    direction = (0, 0)
+
+    def inputs(tick):
+        nonlocal direction
+        if tick % hold == 0:
+            direction = (rng.choice((-1, 0, 1)), rng.choice((-1, 0, 1)))
+        return direction
+
+    return inputs
+
+
 class DialogueBox:
     def __init__(self):
         self.active = False
@@ -142,16 +197,37 @@ class DialogueBox:
         self.font = pygame.font.Font(None, 24)
         self.small_font = pygame.font.Font(None, 20)
         self.rect = pygame.Rect(50, SCREEN_HEIGHT - 180, SCREEN_WIDTH - 100, 150)
+        self.visible_lines = 4
+        self.scroll = 0  # First visible line of the NPC text
+        self.follow = True  # Keep the newest streamed line in view
+        self.layouts = LayoutCache()
+        self.text_cache = TextCache()
 
-    def start_conversation(self, npc_key):
+    def start_conversation(self, npc_key, greeting=None):
         self.active = True
-        self.npc_name = GameConfig.NPCS[npc_key]["name"]
-        self.npc_text = f"Hello! I'm {self.npc_name}. What would you like to say?"
+        self.npc_name = GameConfig.WORLD.npcs[npc_key].name
+        self.npc_text = (
+            greeting or f"Hello! I'm {self.npc_name}. What would you like to say?"
+        )
         self.player_input = ""
+        self.scroll = 0
+        self.follow = True
 
     def set_npc_response(self, text):
+        """Show NPC text; called repeatedly with the growing reply while streaming"""
+        if not text.startswith(self.npc_text):
+            # A new reply resets scrolling and follows the stream
+            self.scroll = 0
+            self.follow = True
         self.npc_text = text
-        self.player_input = ""
+
+    def npc_lines(self):
+        return self.layouts.wrap(self.npc_text, self.small_font, self.rect.width - 20)
+
+    def scroll_by(self, delta):
+        last = max(0, len(self.npc_lines()) - self.visible_lines)
+        self.scroll = max(0, min(last, self.scroll + delta))
+        self.follow = self.scroll == last
 
     def handle_input(self, event):
         if not self.active:
@@ -166,11 +242,19 @@ class DialogueBox:
                     return "send_message"
             elif event.key == pygame.K_BACKSPACE:
                 self.player_input = self.player_input[:-1]
+            elif event.key == pygame.K_PAGEUP:
+                self.scroll_by(-self.visible_lines)
+            elif event.key == pygame.K_PAGEDOWN:
+                self.scroll_by(self.visible_lines)
             else:
                 if len(self.player_input) < 100:  # Limit input length
                     self.player_input += event.unicode
         return False
 
+    def cursor_visible(self):
+        return pygame.time.get_ticks() % 1000 < 500  # Blinking cursor
+
+    @timed("dialogue_draw")
     def draw(self, screen):
         if not self.active:
             return
@@ -180,31 +264,34 @@ class DialogueBox:
         pygame.draw.rect(screen, BLACK, self.rect, 3)
 
         # Draw NPC name
-        name_surface = self.font.render(self.npc_name, True, BLACK)
+        name_surface = self.text_cache.render(self.font, self.npc_name, BLACK)
         screen.blit(name_surface, (self.rect.x + 10, self.rect.y + 5))
 
-        # Draw NPC text (word wrap)
-        words = self.npc_text.split()
-        lines = []
-        current_line = ""
+        # Draw NPC text (word wrap is cached and extended as the reply streams)
+        lines = self.npc_lines()
+        last = max(0, len(lines) - self.visible_lines)
+        if self.follow:
+            self.scroll = last
+        self.scroll = min(self.scroll, last)
 
-        for word in words:
-            test_line = current_line + word + " "
-            if self.small_font.size(test_line)[0] < self.rect.width - 20:
-                current_line = test_line
-            else:
-                if current_line:
-                    lines.append(current_line.strip())
-                current_line = word + " "
-        if current_line:
-            lines.append(current_line.strip())
-
-        for i, line in enumerate(lines[:4]):  # Max 4 lines
-            line_surface = self.small_font.render(line, True, BLACK)
+        visible = lines[self.scroll : self.scroll + self.visible_lines]
+        for i, line in enumerate(visible):
+            line_surface = self.text_cache.render(self.small_font, line, BLACK)
             screen.blit(line_surface, (self.rect.x + 10, self.rect.y + 30 + i * 20))
 
+        # Show that there is more text to scroll to
+        if last:
+            more = ("^ " if self.scroll else "") + ("v" if self.scroll < last else "")
+            more_surface = self.text_cache.render(
+                self.small_font, f"{more.strip()} PgUp/PgDn", GRAY
+            )
+            screen.blit(
+                more_surface,
+                (self.rect.right - more_surface.get_width() - 10, self.rect.y + 8),
+            )
+
         # Draw input prompt
-        prompt_surface = self.small_font.render("You say:", True, BLACK)
+        prompt_surface = self.text_cache.render(self.small_font, "You say:", BLACK)
         screen.blit(prompt_surface, (self.rect.x + 10, self.rect.y + 110))
 
         # Draw input box
@@ -215,12 +302,14 @@ class DialogueBox:
         pygame.draw.rect(screen, BLACK, input_rect, 2)
 
         # Draw input text
-        input_surface = self.small_font.render(self.player_input, True, BLACK)
+        input_surface = self.text_cache.render(
+            self.small_font, self.player_input, BLACK
+        )
         screen.blit(input_surface, (input_rect.x + 5, input_rect.y + 3))
 
         # Draw cursor
-        cursor_x = input_rect.x + 5 + self.small_font.size(self.player_input)[0]
-        if pygame.time.get_ticks() % 1000 < 500:  # Blinking cursor
+        cursor_x = input_rect.x + 5 + input_surface.get_width()
+        if self.cursor_visible():
             pygame.draw.line(
                 screen,
                 BLACK,
@@ -230,110 +319,281 @@ class DialogueBox:
             )
 
 
+SAVE_PATH = os.environ.get("NPC_SAVE_PATH", os.path.join("saves", "village"))
+
+
+class LLMRequest:
+    """A reply in flight. Only the main loop reads or writes these; the
+    worker only knows the id and posts messages about it."""
+
+    __slots__ = ("id", "npc_key", "player_message", "future", "text")
+
+    def __init__(self, request_id, npc_key, player_message):
+        self.id = request_id
+        self.npc_key = npc_key
+        self.player_message = player_message
+        self.future = None
+        self.text = ""
+
+
 class LLMGame:
-    def __init__(self):
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        pygame.display.set_caption("LLM Village Game")
+    def __init__(self, headless=False, save_path=SAVE_PATH, llm=None, cache=None):
+        self.headless = headless
+        if headless:
+            # Render into an off-screen surface; no window is ever opened
+            os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        pygame.init()
+
+        if headless:
+            self.screen = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+        else:
+            self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+            pygame.display.set_caption("LLM Village Game")
         self.clock = pygame.time.Clock()
         self.font = pygame.font.Font(None, 24)
         self.small_font = pygame.font.Font(None, 18)
+        self.text_cache = TextCache()
+        self.renderer = DirtyRenderer(self.screen, self.build_background())
 
         # Game objects
-        self.player = Player(500, 350)
+        self.sim = VillageSim()
+        self.spatial = self.sim.spatial
+        self.player = self.sim.player
         self.dialogue = DialogueBox()
         self.game_state = GameState.EXPLORING
         self.conversation_history = {}
+        self.prompts = {}
         self.current_npc = None
-        self.ai_thinking = False
+        self.requests = {}  # In-flight LLMRequests by id
+        self.request_ids = itertools.count(1)
+        self.inbox = queue.SimpleQueue()  # Worker -> main loop messages
+        self.llm = llm or get_gateway()
+        self.cache = cache or get_cache()
+        self.prefetcher = Prefetcher(self.llm)
+        self.metrics = get_metrics()
+        self.metrics_path = None  # Where to write metrics on quit
+        self.show_perf = False  # F3 overlay
+        self.perf_lines = ()
+        self.perf_updated = 0.0
+
+        # Player is restored now; conversations are read when first needed
+        self.saves = SaveStore(save_path).open() if save_path else None
+        if self.saves is not None:
+            self.saves.bind("player", self.player)
+
+    @property
+    def ai_thinking(self):
+        return bool(self.requests)
+
+    @timed("call_llm_async")
+    def call_llm_async(self, prompt, npc_key, player_message):
+        """Stream the LLM reply on the shared gateway loop; returns a request id.
+
+        The worker never touches game state. It posts ("token" | "reply" |
+        "error", request id, text) to the inbox, which drain_inbox() applies
+        once per frame on the main loop.
+        """
+        request = LLMRequest(next(self.request_ids), npc_key, player_message)
+        self.requests[request.id] = request
+        request.future = self.llm.submit(
+            self.request_reply(request.id, prompt, npc_key, player_message)
+        )
+        return request.id
+
+    def cancel_request(self, request_id):
+        """Stop a reply; anything it already posted is ignored"""
+        request = self.requests.pop(request_id, None)
+        if request is not None:
+            request.future.cancel()
+
+    async def request_reply(self, request_id, prompt, npc_key, player_message):
+        post = self.inbox.put
+        try:
+            ai_response = await self.fetch_reply(
+                prompt,
+                npc_key,
+                player_message,
+                on_token=lambda chunk: post(("token", request_id, chunk)),
+            )
+            post(("reply", request_id, ai_response))
+        except asyncio.CancelledError:
+            # Preempted or shut down; don't leave the dialogue waiting
+            post(("error", request_id, "Sorry, I lost my train of thought."))
+            raise
+        except Exception as e:
+            post(("error", request_id, f"Sorry, I can't respond right now. ({e})"))
+
+    def drain_inbox(self):
+        """Apply everything the workers posted since the last frame"""
+        while True:
+            try:
+                kind, key, payload = self.inbox.get_nowait()
+            except queue.Empty:
+                return
 
-    def call_llm_async(self, prompt, npc_key):
-        """Call LLM in a separate thread to avoid blocking"""
+            if kind == "greeting":
+                self.show_greeting(key, payload)
+                continue
+
+            request = self.requests.get(key)
+            if request is None:
+                continue  # Cancelled
+            showing = self.dialogue.active and self.current_npc == request.npc_key
+
+            if kind == "token":
+                request.text += payload
+                if showing:
+                    self.dialogue.set_npc_response(request.text)
+                continue
+
+            del self.requests[key]
+            if kind == "reply":
+                self.record_exchange(request.npc_key, request.player_message, payload)
+            if showing:
+                self.dialogue.set_npc_response(payload)
+                if self.game_state == GameState.WAITING_FOR_AI:
+                    self.game_state = GameState.TALKING
 
-        def make_request():
-            try:
-                self.ai_thinking = True
-                response = requests.post(
-                    GameConfig.API_URL, json={"prompt": prompt}, timeout=30
-                )
-                response.raise_for_status()
-                data = response.json()
-                ai_response = data.get("response", "I'm not sure what to say...")
-
-                # Update conversation history
-                if npc_key not in self.conversation_history:
-                    self.conversation_history[npc_key] = ""
-                self.conversation_history[
-                    npc_key
-                ] += f"Player: {self.dialogue.player_input}\n{GameConfig.NPCS[npc_key]['name']}: {ai_response}\n"
-
-                # Update dialogue
-                self.dialogue.set_npc_response(ai_response)
-                self.ai_thinking = False
-                self.game_state = GameState.TALKING
-
-            except requests.RequestException as e:
-                self.dialogue.set_npc_response(
-                    f"Sorry, I can't respond right now. ({str(e)})"
-                )
-                self.ai_thinking = False
-                self.game_state = GameState.TALKING
-
-        thread = threading.Thread(target=make_request)
-        thread.daemon = True
-        thread.start()
-
-    def build_npc_context(self, npc_key):
-        """Build context for LLM based on game state"""
-        npc = GameConfig.NPCS[npc_key]
-
-        context = f"{GameConfig.WORLD_CONTEXT}\n\n"
-        context += f"You are {npc['name']}, {npc['personality']}\n"
-        context += f"Location: {npc['location']}\n"
-        context += f"Player location: {self.player.current_location}\n"
-
-        # Add conversation history if exists
-        if npc_key in self.conversation_history:
-            context += (
-                f"Previous conversation: {self.conversation_history[npc_key][-300:]}\n"
+    def pending_for(self, npc_key):
+        return [r.id for r in self.requests.values() if r.npc_key == npc_key]
+
+    async def fetch_reply(
+        self, prompt, npc_key, player_message, on_token=None, priority=PLAYER
+    ):
+        """Reply text for a player message, from the cache or the LLM"""
+        # Greetings and common questions come straight from the cache
+        cacheable = is_cacheable(player_message)
+        if cacheable:
+            cached = await self.cache.lookup(npc_key, player_message, priority=priority)
+            if cached is not None:
+                return cached
+
+        # Greetings and small talk are answered by the small model
+        npc = GameConfig.WORLD.npcs[npc_key]
+        router = get_router()
+        route = router.route(player_message, npc.name, npc.extra.get("model"))
+        ai_response = await router.run(
+            route,
+            lambda model, emit: self.llm.generate(
+                GameConfig.API_URL,
+                prompt,
+                on_token=emit,
+                priority=priority,
+                reply_filter=ReplyFilter(max_words=80),
+                model=model,
+            ),
+            on_token,
+        )
+        if cacheable and ai_response.strip():
+            await self.cache.store(
+                npc_key, player_message, ai_response, priority=priority
             )
+        return ai_response.strip() or "I'm not sure what to say..."
+
+    def history(self, npc_key):
+        """Conversation memory for an NPC, created (and bound to the save) on demand"""
+        if npc_key not in self.conversation_history:
+            memory = ConversationMemory(max_turns=6, llm=self.llm)
+            if self.saves is not None:
+                self.saves.bind(f"chat:{npc_key}", memory, lazy=True)
+            self.conversation_history[npc_key] = memory
+        return self.conversation_history[npc_key]
+
+    def record_exchange(self, npc_key, player_message, ai_response):
+        """Update conversation history"""
+        self.history(npc_key).add("user", player_message)
+        self.history(npc_key).add("assistant", ai_response)
+
+    def prefetch_greeting(self, npc_key):
+        """Start generating an NPC's opening line before the player clicks"""
+        prompt = self.build_npc_context(npc_key, GameConfig.GREETING)
+        return self.fetch_reply(prompt, npc_key, GameConfig.GREETING, priority=PREFETCH)
+
+    def show_greeting(self, npc_key, future):
+        """Replace the placeholder greeting once the prefetch finishes"""
+        greeting = Prefetcher.result(future)
+        if greeting and self.current_npc == npc_key and self.dialogue.active:
+            self.record_exchange(npc_key, GameConfig.GREETING, greeting)
+            self.dialogue.set_npc_response(greeting)
+
+    @timed("build_npc_context")
+    def build_npc_context(self, npc_key, player_message):
+        """Build the LLM prompt for a player message based on game state"""
+        world = GameConfig.WORLD
+        npc = world.npcs[npc_key]
+
+        # The static part of each NPC's prompt is built once and reused as-is
+        if npc_key not in self.prompts:
+            self.prompts[npc_key] = PromptBuilder(
+                f"{world.context}\n\n"
+                f"You are {npc.name}, a {npc.role}. Personality: {npc.personality}\n"
+                f"Location: {world.locations[npc.location].name}\n"
+            )
+
+        history = self.history(npc_key).lines("Player", npc.name)
 
-        context += "\nPlayer says: "
-        return context
+        return self.prompts[npc_key].build_text(
+            history,
+            player_message,
+            context=f"Player location: {self.player.current_location}",
+        )
 
     def handle_npc_click(self, pos):
         """Check if player clicked on an NPC"""
-        for npc_key, npc_data in GameConfig.NPCS.items():
-            npc_x, npc_y = npc_data["pos"]
-            distance = ((pos[0] - npc_x) ** 2 + (pos[1] - npc_y) ** 2) ** 0.5
-
-            if distance < 20:  # NPC click radius
-                # Check if player is close enough
-                player_distance = (
-                    (self.player.x - npc_x) ** 2 + (self.player.y - npc_y) ** 2
-                ) ** 0.5
-                if player_distance < 80:  # Talking distance
-                    self.current_npc = npc_key
-                    self.dialogue.start_conversation(npc_key)
-                    self.game_state = GameState.TALKING
-                    return True
-                else:
-                    # Show "too far" message briefly
-                    pass
+        npc_key = self.spatial.nearest(pos[0], pos[1], 20)  # NPC click radius
+        if npc_key is None:
+            return False
+
+        # Check if player is close enough
+        npc_x, npc_y = self.spatial.points[npc_key]
+        player_distance = (
+            (self.player.x - npc_x) ** 2 + (self.player.y - npc_y) ** 2
+        ) ** 0.5
+        if player_distance < 80:  # Talking distance
+            self.current_npc = npc_key
+
+            # Use the greeting prefetched while the player walked over
+            future = self.prefetcher.claim(npc_key)
+            greeting = Prefetcher.result(future)
+            self.dialogue.start_conversation(npc_key, greeting)
+            if greeting:
+                self.record_exchange(npc_key, GameConfig.GREETING, greeting)
+            elif future is not None and not future.done():
+                # Runs on the gateway thread: hand the result to the main loop
+                future.add_done_callback(
+                    lambda f: self.inbox.put(("greeting", npc_key, f))
+                )
+
+            self.game_state = GameState.TALKING
+            return True
+        else:
+            # Show "too far" message briefly
+            pass
         return False
 
+    @timed("handle_events")
     def handle_events(self):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 return False
 
             elif event.type == pygame.KEYDOWN:
-                if (
-                    event.key == pygame.K_ESCAPE
-                    and self.game_state == GameState.TALKING
+                if event.key == pygame.K_F3:
+                    self.show_perf = not self.show_perf
+                elif event.key == pygame.K_ESCAPE and self.game_state in (
+                    GameState.TALKING,
+                    GameState.WAITING_FOR_AI,
                 ):
+                    # Walking away abandons a reply that is still coming
+                    for request_id in self.pending_for(self.current_npc):
+                        self.cancel_request(request_id)
                     self.dialogue.active = False
                     self.game_state = GameState.EXPLORING
 
+                    # Fold a long journal into a fresh snapshot between talks
+                    if self.saves is not None:
+                        self.saves.save(force=False)
+
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 if self.game_state == GameState.EXPLORING:
                     self.handle_npc_click(event.pos)
@@ -341,107 +601,290 @@ class LLMGame:
             # Handle dialogue input
             if self.game_state == GameState.TALKING:
                 result = self.dialogue.handle_input(event)
-                if result == "send_message" and not self.ai_thinking:
+                if result == "send_message" and not self.pending_for(self.current_npc):
                     # Send message to LLM
-                    context = self.build_npc_context(self.current_npc)
-                    full_prompt = context + self.dialogue.player_input
+                    player_message = self.dialogue.player_input
+                    full_prompt = self.build_npc_context(
+                        self.current_npc, player_message
+                    )
+                    self.dialogue.player_input = ""
 
                     self.game_state = GameState.WAITING_FOR_AI
-                    self.call_llm_async(full_prompt, self.current_npc)
+                    self.call_llm_async(full_prompt, self.current_npc, player_message)
 
         return True
 
-    def update(self):
-        if self.game_state == GameState.EXPLORING:
-            # Handle player movement
-            keys = pygame.key.get_pressed()
-            dx = dy = 0
-
-            if keys[pygame.K_a] or keys[pygame.K_LEFT]:
-                dx = -1
-            if keys[pygame.K_d] or keys[pygame.K_RIGHT]:
-                dx = 1
-            if keys[pygame.K_w] or keys[pygame.K_UP]:
-                dy = -1
-            if keys[pygame.K_s] or keys[pygame.K_DOWN]:
-                dy = 1
-
-            if dx != 0 or dy != 0:
-                self.player.move(dx, dy)
+    def read_movement(self):
+        """Movement direction from the keyboard"""
+        keys = pygame.key.get_pressed()
+        dx = dy = 0
+
+        if keys[pygame.K_a] or keys[pygame.K_LEFT]:
+            dx = -1
+        if keys[pygame.K_d] or keys[pygame.K_RIGHT]:
+            dx = 1
+        if keys[pygame.K_w] or keys[pygame.K_UP]:
+            dy = -1
+        if keys[pygame.K_s] or keys[pygame.K_DOWN]:
+            dy = 1
+        return dx, dy
+
+    @timed("update")
+    def update(self, dt=TICK, movement=(0, 0)):
+        """Advance one fixed timestep"""
+        dx, dy = movement if self.game_state == GameState.EXPLORING else (0, 0)
+        self.sim.talking = self.current_npc if self.dialogue.active else None
+        self.sim.step(dx, dy, dt)
+
+        # Prefetch greetings of NPCs coming into range; villagers walk too,
+        # so this runs whether or not the player is moving
+        distances = dict(
+            self.spatial.query_radius(
+                self.player.x, self.player.y, self.prefetcher.cancel_radius
+            )
+        )
+        for npc_key in self.prefetcher.futures:
+            distances.setdefault(npc_key, float("inf"))
+        distances.pop(self.sim.talking, None)  # Already talking; no greeting
+        self.prefetcher.update(distances, self.prefetch_greeting)
 
-    def draw(self):
-        self.screen.fill(DARK_GREEN)  # Background
+    def build_background(self):
+        """Pre-render everything that doesn't change: ground and locations"""
+        background = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+        background.fill(DARK_GREEN)
 
         # Draw locations
-        for loc_name, loc_data in GameConfig.LOCATIONS.items():
-            pygame.draw.rect(self.screen, loc_data["color"], loc_data["rect"])
-            pygame.draw.rect(self.screen, BLACK, loc_data["rect"], 2)
+        for loc in GameConfig.WORLD.locations.values():
+            if loc.rect is None:
+                continue  # Indoors, not on the map
+            rect = pygame.Rect(loc.rect)
+            pygame.draw.rect(background, loc.color or LIGHT_GRAY, rect)
+            pygame.draw.rect(background, BLACK, rect, 2)
 
             # Draw location name
-            text_surface = self.small_font.render(loc_data["name"], True, BLACK)
-            text_rect = text_surface.get_rect(center=loc_data["rect"].center)
-            self.screen.blit(text_surface, text_rect)
-
-        # Draw NPCs
-        for npc_key, npc_data in GameConfig.NPCS.items():
-            x, y = npc_data["pos"]
-            pygame.draw.circle(self.screen, npc_data["color"], (x, y), 15)
-            pygame.draw.circle(self.screen, BLACK, (x, y), 15, 2)
-
-            # Draw NPC name
-            name_surface = self.small_font.render(npc_data["name"], True, BLACK)
-            name_rect = name_surface.get_rect(center=(x, y - 25))
-            self.screen.blit(name_surface, name_rect)
-
-        # Draw player
-        self.player.draw(self.screen)
+            text_surface = self.small_font.render(loc.name, True, BLACK)
+            text_rect = text_surface.get_rect(center=rect.center)
+            background.blit(text_surface, text_rect)
+
+        return background
+
+    def npc_sprite(self, row, key):
+        """A named NPC and its label, wherever it has wandered to"""
+        npc = GameConfig.WORLD.npcs[key]
+        x, y = (int(v) for v in self.sim.crowd.pos[row])
+        name_surface = self.text_cache.render(self.small_font, npc.name, BLACK)
+        name_rect = name_surface.get_rect(center=(x, y - 25))
+
+        def draw(screen):
+            pygame.draw.circle(screen, npc.color or RED, (x, y), 15)
+            pygame.draw.circle(screen, BLACK, (x, y), 15, 2)
+            screen.blit(name_surface, name_rect)
+
+        return Sprite(pygame.Rect(x - 16, y - 16, 33, 33).union(name_rect), None, draw)
+
+    def draw_crowd(self, screen):
+        """Villagers as 2x2 dots, written straight into the pixels"""
+        crowd = self.sim.crowd
+        pos = crowd.pos[crowd.named :].astype(np.intp)
+        clip = screen.get_clip()
+        inside = (
+            (pos[:, 0] >= clip.left)
+            & (pos[:, 0] < clip.right - 1)
+            & (pos[:, 1] >= clip.top)
+            & (pos[:, 1] < clip.bottom - 1)
+        )
+        xs, ys = pos[inside, 0], pos[inside, 1]
+        pixels = pygame.surfarray.pixels3d(screen)
+        for ox, oy in ((0, 0), (1, 0), (0, 1), (1, 1)):
+            pixels[xs + ox, ys + oy] = LIGHT_GRAY
+        del pixels  # Unlock the surface
 
-        # Draw UI
+    def draw_ui(self, screen):
         ui_rect = pygame.Rect(0, SCREEN_HEIGHT - 50, SCREEN_WIDTH, 50)
-        pygame.draw.rect(self.screen, LIGHT_GRAY, ui_rect)
-        pygame.draw.rect(self.screen, BLACK, ui_rect, 2)
+        pygame.draw.rect(screen, LIGHT_GRAY, ui_rect)
+        pygame.draw.rect(screen, BLACK, ui_rect, 2)
 
         # Draw location info
         location_text = f"Location: {self.player.current_location}"
-        location_surface = self.font.render(location_text, True, BLACK)
-        self.screen.blit(location_surface, (10, SCREEN_HEIGHT - 40))
+        location_surface = self.text_cache.render(self.font, location_text, BLACK)
+        screen.blit(location_surface, (10, SCREEN_HEIGHT - 40))
 
         # Draw controls
         if self.game_state == GameState.EXPLORING:
-            controls_text = "WASD: Move | Click NPCs to talk | ESC: Exit dialogue"
+            controls_text = (
+                "WASD: Move | Click NPCs to talk | ESC: Exit dialogue | F3: Stats"
+            )
         elif self.game_state == GameState.TALKING:
             controls_text = "Type message and press ENTER | ESC: Stop talking"
         else:
             controls_text = "AI is thinking..."
 
-        controls_surface = self.small_font.render(controls_text, True, BLACK)
-        self.screen.blit(controls_surface, (10, SCREEN_HEIGHT - 20))
+        controls_surface = self.text_cache.render(self.small_font, controls_text, BLACK)
+        screen.blit(controls_surface, (10, SCREEN_HEIGHT - 20))
+
+    def draw_thinking(self, screen):
+        thinking_surface = self.text_cache.render(self.font, "AI is thinking...", RED)
+        screen.blit(thinking_surface, (SCREEN_WIDTH - 200, 10))
+
+    def perf_text(self):
+        """Overlay lines, refreshed a few times a second so they stay readable"""
+        now = time.monotonic()
+        if now - self.perf_updated >= 0.25:
+            self.perf_updated = now
+            m = self.metrics
+            frame = m.percentiles("frame")
+            spans = " ".join(
+                f"{name} {m.percentiles(name)['p95'] * 1000:.1f}"
+                for name in ("handle_events", "update", "draw")
+            )
+            self.perf_lines = (
+                "frame ms p50 {:.1f} p95 {:.1f} p99 {:.1f}".format(
+                    *(frame[q] * 1000 for q in ("p50", "p95", "p99"))
+                ),
+                f"p95 ms {spans}",
+                f"LLM queued {m.value('llm_queue_depth'):.0f} "
+                f"running {m.value('llm_running'):.0f} "
+                f"{m.rate('llm_tokens'):.0f} tok/s",
+            )
+        return self.perf_lines
 
-        # Draw dialogue box
-        self.dialogue.draw(self.screen)
+    def draw_perf(self, screen):
+        rect = pygame.Rect(10, 10, 300, 60)
+        pygame.draw.rect(screen, BLACK, rect)
+        for i, line in enumerate(self.perf_lines):
+            surface = self.text_cache.render(self.small_font, line, WHITE)
+            screen.blit(surface, (rect.x + 6, rect.y + 5 + i * 17))
 
-        # Draw AI thinking indicator
-        if self.ai_thinking:
-            thinking_surface = self.font.render("AI is thinking...", True, RED)
-            self.screen.blit(thinking_surface, (SCREEN_WIDTH - 200, 10))
+    @timed("draw")
+    def draw(self):
+        # Dynamic layers in z-order; only the ones that changed get redrawn
+        dialogue = self.dialogue
+        crowd = self.sim.crowd
+        sprites = {}
+        if len(crowd) > crowd.named:
+            sprites["crowd"] = Sprite(
+                pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT - 50),
+                self.sim.ticks,
+                self.draw_crowd,
+            )
+        for row, key in enumerate(crowd.keys):
+            sprites[f"npc:{key}"] = self.npc_sprite(row, key)
+        sprites.update(
+            {
+                "player": Sprite(self.player.rect(), None, self.player.draw),
+                "ui": Sprite(
+                    pygame.Rect(0, SCREEN_HEIGHT - 50, SCREEN_WIDTH, 50),
+                    (self.player.current_location, self.game_state),
+                    self.draw_ui,
+                ),
+                "dialogue": Sprite(
+                    dialogue.rect if dialogue.active else None,
+                    (
+                        dialogue.npc_name,
+                        dialogue.npc_text,
+                        dialogue.player_input,
+                        dialogue.scroll,
+                        dialogue.follow,
+                        dialogue.cursor_visible(),
+                    ),
+                    dialogue.draw,
+                ),
+                "thinking": Sprite(
+                    (
+                        pygame.Rect(SCREEN_WIDTH - 200, 10, 190, 20)
+                        if self.ai_thinking
+                        else None
+                    ),
+                    None,
+                    self.draw_thinking,
+                ),
+                "perf": Sprite(
+                    pygame.Rect(10, 10, 300, 60) if self.show_perf else None,
+                    self.perf_text() if self.show_perf else None,
+                    self.draw_perf,
+                ),
+            }
+        )
 
-        pygame.display.flip()
+        dirty = self.renderer.render(sprites)
+        if dirty and not self.headless:
+            pygame.display.update(dirty)
 
     def run(self):
         print("Starting LLM Village Game!")
         print("Make sure your FastAPI server is running on http://127.0.0.1:8000")
 
+        # Simulation runs at a fixed rate however fast frames are drawn
         running = True
+        accumulator = 0.0
         while running:
-            running = self.handle_events()
-            self.update()
-            self.draw()
-            self.clock.tick(FPS)
+            accumulator += min(self.clock.tick(FPS) / 1000, MAX_FRAME_TIME)
+
+            # Work done per frame, not counting the wait for the next one
+            with self.metrics.span("frame"):
+                self.drain_inbox()
+                running = self.handle_events()
+                movement = self.read_movement()
+                while accumulator >= TICK:
+                    self.update(TICK, movement)
+                    accumulator -= TICK
+                self.draw()
+
+        self.quit()
+        sys.exit()
 
+    def run_headless(self, ticks, inputs=None, render_every=0, realtime=False):
+        """Run without a display; as fast as possible unless realtime is set.
+
+        inputs(tick) returns the movement for a tick, e.g. a replayed session
+        or random_walk(). Returns ticks per second of simulated time.
+        """
+        start = time.perf_counter()
+        for tick in range(ticks):
+            with self.metrics.span("frame"):
+                self.drain_inbox()
+                self.update(TICK, inputs(tick) if inputs else (0, 0))
+                if render_every and tick % render_every == 0:
+                    self.draw()
+            if realtime:
+                self.clock.tick(1 / TICK)
+        elapsed = time.perf_counter() - start
+        return ticks / elapsed if elapsed else float("inf")
+
+    def quit(self):
+        self.prefetcher.cancel_all()
+        for request_id in list(self.requests):
+            self.cancel_request(request_id)
+        if self.metrics_path:
+            self.metrics.write(self.metrics_path)
+        if self.saves is not None:
+            self.saves.save()
+            self.saves.close()
+        self.llm.close()
         pygame.quit()
-        sys.exit()
 
 
 if __name__ == "__main__":
-    game = LLMGame()
-    game.run()
+    parser = argparse.ArgumentParser(description="LLM Village Game")
+    parser.add_argument("--headless", action="store_true", help="run without a display")
+    parser.add_argument("--ticks", type=int, default=3600, help="headless ticks to run")
+    parser.add_argument("--seed", type=int, default=0, help="headless random walk seed")
+    parser.add_argument(
+        "--metrics", help="write timings on exit (.prom for Prometheus, else JSON)"
+    )
+    parser.add_argument(
+        "--log-level", default="WARNING", help="INFO shows model routing decisions"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper())
+
+    if args.headless:
+        game = LLMGame(headless=True)
+        game.metrics_path = args.metrics
+        rate = game.run_headless(args.ticks, random_walk(args.seed))
+        print(f"{args.ticks} ticks at {rate:.0f} ticks/s")
+        game.quit()
+    else:
+        game = LLMGame()
+        game.metrics_path = args.metrics
+        game.run()
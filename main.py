@@ -1,14 +1,30 @@
-import os
-from dotenv import load_dotenv
-from fastapi import FastAPI
-from langchain_core import prompts
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException
 from langchain_ollama.llms import OllamaLLM
 from langchain_core.prompts import ChatPromptTemplate
-from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from src.llm.batching import MicroBatcher, QueueFull, StreamCoalescer
+from src.llm.postprocess import ReplyFilter, clean_reply
+from src.llm.router import LARGE_MODEL, SMALL_MODEL
+from src.perf import get_metrics
+
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for batcher in batchers.values():
+        batcher.start()
+    yield
+    for batcher in batchers.values():
+        await batcher.stop()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 
 app.add_middleware(
@@ -20,8 +36,11 @@ app.add_middleware(
 )
 
 
-model = OllamaLLM(model="deepseek-r1")
-model2 = OllamaLLM(model="deepseek-r1")
+# One client per tier; the game's router names the model for each request
+models = {
+    name: OllamaLLM(model=name) for name in dict.fromkeys([LARGE_MODEL, SMALL_MODEL])
+}
+model = models[LARGE_MODEL]
 
 template = """
             {{ 
@@ -42,6 +61,97 @@ prompt = ChatPromptTemplate.from_template(template)
 
 chain = prompt | model
 
-result = chain.invoke({"reviews": [], "question": "Where am i , what is this place"})
+REPLY_WORDS = 80
+
+
+async def generate_batch(llm, prompts):
+    """Batch completion with deepseek-r1 reasoning removed"""
+    return [clean_reply(text, REPLY_WORDS) for text in await llm.abatch(prompts)]
+
+
+async def generate_stream(llm, prompt):
+    """Stream only the visible reply, and stop generating once it is long enough"""
+    reply = ReplyFilter(max_words=REPLY_WORDS)
+    stream = llm.astream(prompt)
+    try:
+        async for chunk in stream:
+            visible = reply.feed(chunk)
+            if visible:
+                yield visible
+            if reply.done:
+                return
+        tail = reply.finish()
+        if tail:
+            yield tail
+    finally:
+        await stream.aclose()
+
+
+# Concurrent NPC prompts are batched, and identical in-flight prompts share
+# one generation; past max_pending distinct prompts clients get a 429
+# (per model, since a batch can only go to one model)
+batchers = {
+    name: MicroBatcher(
+        partial(generate_batch, llm), max_batch=8, max_wait=0.02, max_pending=64
+    )
+    for name, llm in models.items()
+}
+streams = {
+    name: StreamCoalescer(partial(generate_stream, llm), max_pending=64)
+    for name, llm in models.items()
+}
+
+metrics = get_metrics()
+metrics.gauge("batch_pending", lambda: sum(b.pending for b in batchers.values()))
+metrics.gauge("stream_pending", lambda: sum(len(s.inflight) for s in streams.values()))
+
+
+class GenerateRequest(BaseModel):
+    prompt: str
+    stream: bool = False
+    model: Optional[str] = None  # Defaults to the large model
+
+
+@app.post("/generate")
+async def generate(request: GenerateRequest):
+    """Generate an NPC reply, streaming plain-text chunks when requested"""
+    name = request.model or LARGE_MODEL
+    if name not in models:
+        raise HTTPException(status_code=400, detail=f"unknown model '{name}'")
+    try:
+        if request.stream:
+            return StreamingResponse(
+                streams[name].subscribe(request.prompt),
+                media_type="text/plain; charset=utf-8",
+            )
+
+        with metrics.span("generate"):
+            response = await batchers[name].submit(request.prompt)
+    except QueueFull as e:
+        raise HTTPException(
+            status_code=429, detail=str(e), headers={"Retry-After": "1"}
+        )
+    return {"response": response}
+
+
+@app.get("/stats")
+async def stats():
+    """Queue depth, batching and coalescing counters"""
+    return {
+        name: {"batch": batchers[name].stats(), "stream": streams[name].stats()}
+        for name in models
+    }
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Request timings and queue depths in Prometheus text format"""
+    return PlainTextResponse(metrics.to_prometheus(prefix="npc_server"))
+
+
+if __name__ == "__main__":
+    result = chain.invoke(
+        {"reviews": [], "question": "Where am i , what is this place"}
+    )
 
-print(result)
+    print(result)
@@ -1,4 +1,5 @@
-if __name__ == "main":
+if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run("app.main:app", host="0.0.0.0", reload=True)
+    # Multiplayer game server; main.py stays the /generate LLM endpoint
+    uvicorn.run("src.game.server:app", host="0.0.0.0", port=8100)
@@ -0,0 +1,49 @@
+## non-blocking console input
+import asyncio
+import sys
+import threading
+from typing import Optional, TextIO
+
+
+class AsyncInput:
+    """Reads stdin on a daemon thread and hands lines to asyncio.
+
+    The builtin input() blocks the event loop, which freezes streaming,
+    prefetch and ambient NPC chatter while the game waits for the player.
+    Here only the reader thread blocks; coroutines await readline(), and
+    lines typed while a reply is still streaming are queued for later.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None):
+        self.stream = stream or sys.stdin
+        self.queue: Optional[asyncio.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start reading; must be called from the loop that will await lines"""
+        if self._thread is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self._thread = threading.Thread(
+            target=self._read, args=(loop,), name="console-input", daemon=True
+        )
+        self._thread.start()
+
+    def _read(self, loop: asyncio.AbstractEventLoop):
+        while True:
+            line = self.stream.readline()
+            if not line:
+                loop.call_soon_threadsafe(self.queue.put_nowait, None)  # EOF
+                return
+            loop.call_soon_threadsafe(self.queue.put_nowait, line.rstrip("\r\n"))
+
+    async def readline(self, prompt: str = "") -> Optional[str]:
+        """Next line typed by the player, or None once stdin is closed"""
+        self.start()
+        if prompt:
+            print(prompt, end="", flush=True)
+        line = await self.queue.get()
+        if line is None:
+            self.queue.put_nowait(None)  # Stay closed for later readers
+        return line
@@ -1,151 +1,414 @@
 ## game state
 import asyncio
-from ollama import AsyncClient
 import json
+import logging
+import os
+import sys
+import uuid
+from collections import deque
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
+
+from src.game.console import AsyncInput
+from src.game.save import SaveStore
+from src.game.world import WorldDef, load_world
+from src.llm.cache import ResponseCache, get_cache, is_cacheable
+from src.llm.gateway import LLMGateway, get_gateway
+from src.llm.episodic import EpisodicMemory
+from src.llm.memory import ConversationMemory
+from src.llm.postprocess import ReplyFilter
+from src.llm.prefetch import Prefetcher
+from src.llm.prompt import PromptBuilder
+from src.llm.router import Override, get_router
+from src.llm.scheduler import AMBIENT, PLAYER, PREFETCH, AmbientScheduler
+from src.perf import timed
 
 
 class NPC:
-    def __init__(self, name: str, role: str, personality: str, location: str):
+    """One character: identity, memories and access to the shared gateway.
+
+    Kept small because a world can spawn thousands: slots instead of a
+    __dict__, roles and locations interned, and the system prompt only
+    built once the NPC first has to answer. The gateway (and its HTTP
+    client) and the response cache are shared, never owned.
+    """
+
+    __slots__ = (
+        "name",
+        "role",
+        "personality",
+        "location",
+        "llm",
+        "memory",
+        "episodes",
+        "cache",
+        "model",
+        "_prompt",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        role: str,
+        personality: str,
+        location: str,
+        llm: Optional[LLMGateway] = None,
+        cache: Optional[ResponseCache] = None,
+        model: Optional[Override] = None,
+    ):
         self.name = name
-        self.role = role
+        self.role = sys.intern(role)
         self.personality = personality
-        self.location = location
-        self.memory = []  # Store conversation history
-        self.client = AsyncClient()
-
-    async def talk(self, player_input: str, player_name: str = "Traveler") -> str:
-        """Generate NPC response using LLM"""
-
-        # Build conversation history for context
-        messages = [
-            {
-                "role": "system",
-                "content": f"""You are {self.name}, a {self.role} in a fantasy world.
+        self.location = sys.intern(location)
+        self.llm = llm or get_gateway()  # Shared by all NPCs
+        self.memory = ConversationMemory(max_turns=10, llm=self.llm)
+        self.episodes = EpisodicMemory(llm=self.llm)  # Everything older
+        self.cache = cache or get_cache()
+        self.model = model  # Pins a model (or a model per intent) for this NPC
+        self._prompt: Optional[PromptBuilder] = None
+
+    @property
+    def prompt(self) -> PromptBuilder:
+        """Static system prompt, assembled and counted once, on first use"""
+        if self._prompt is None:
+            self._prompt = PromptBuilder(
+                f"""You are {self.name}, a {self.role} in a fantasy world.
 Personality: {self.personality}
 You are currently in: {self.location}
 Remember previous conversations and refer to them naturally.
-Keep responses concise (2-3 sentences) unless asked for more detail.""",
-            }
-        ]
+Keep responses concise (2-3 sentences) unless asked for more detail."""
+            )
+        return self._prompt
+
+    @timed("npc_talk")
+    async def talk(
+        self,
+        player_input: str,
+        player_name: str = "Traveler",
+        on_token: Optional[Callable[[str], None]] = None,
+        reply: Optional[str] = None,
+        player_id: Optional[str] = None,
+    ) -> str:
+        """Generate NPC response using LLM, streaming chunks to on_token if given
+
+        A reply prepared ahead of time (e.g. a prefetched greeting) is used
+        as-is instead of calling the model. Cached replies are shared only
+        with the same player_id (by default, the same name).
+        """
+        try:
+            if reply is None:
+                npc_response = await self.respond(
+                    player_input, player_name, on_token, player_id=player_id
+                )
+            else:
+                npc_response = reply
+                if on_token is not None:
+                    on_token(reply)
 
-        # Add conversation history (last 10 exchanges to manage context)
-        for memory in self.memory[-10:]:
-            messages.append({"role": memory["role"], "content": memory["content"]})
+            # Store this exchange in memory
+            self.memory.add("user", player_input, speaker=player_name)
+            self.memory.add("assistant", npc_response)
+            if not player_input.startswith("*"):
+                self.episodes.remember(
+                    f"{player_name}: {player_input}\n{self.name}: {npc_response}"
+                )
 
-        # Add current player input
-        messages.append({"role": "user", "content": f"{player_name}: {player_input}"})
+            return npc_response
 
-        try:
-            # Get response from LLM
-            response = await self.client.chat(
-                model="deepseek-r1", messages=messages  # Using deepseek-r1 as specified
+        except Exception as e:
+            return f"*{self.name} seems distracted and doesn't respond properly* (Error: {e})"
+
+    async def respond(
+        self,
+        player_input: str,
+        player_name: str = "Traveler",
+        on_token: Optional[Callable[[str], None]] = None,
+        priority: int = PLAYER,
+        use_cache: bool = True,
+        player_id: Optional[str] = None,
+    ) -> str:
+        """Generate a reply without recording it in memory"""
+        player_id = player_id or player_name
+
+        # Greetings and common questions come straight from the cache
+        cacheable = use_cache and is_cacheable(player_input)
+        if cacheable:
+            npc_response = await self.cache.lookup(
+                self.name, player_input, player_id, priority
             )
+            if npc_response is not None:
+                if on_token is not None:
+                    on_token(npc_response)
+                return npc_response
+
+        # Older exchanges that matter now; the last few are in memory anyway
+        recalled = await self.episodes.recall(
+            player_input, skip_recent=len(self.memory) // 2, priority=priority
+        )
+        context = None
+        if recalled:
+            context = "You remember:\n" + "\n".join(f"- {r}" for r in recalled)
 
-            npc_response = response["message"]["content"]
+        # Static prefix, then as much history as fits the token budget
+        messages = self.prompt.build_messages(
+            self.memory.messages(), f"{player_name}: {player_input}", context
+        )
 
-            # Store this exchange in memory
-            self.memory.append(
-                {"role": "user", "content": f"{player_name}: {player_input}"}
+        # Get response from LLM; small talk goes to the small model
+        router = get_router()
+        route = router.route(player_input, self.name, self.model)
+        npc_response = await router.run(
+            route,
+            lambda model, emit: self.llm.chat(
+                messages,
+                model=model,
+                on_token=emit,
+                options=self.prompt.options,
+                priority=priority,
+                reply_filter=ReplyFilter(max_words=80, max_sentences=3),
+            ),
+            on_token,
+        )
+        if cacheable:
+            await self.cache.store(
+                self.name, player_input, npc_response, player_id, priority
             )
-            self.memory.append({"role": "assistant", "content": npc_response})
+        return npc_response
+
+    async def chat_with(self, other: "NPC", priority: int = AMBIENT) -> str:
+        """Exchange a line with another NPC; both remember it"""
+        opener = await self.respond(
+            f"*notices {other.name} nearby*",
+            other.name,
+            priority=priority,
+            use_cache=False,
+        )
+        reply = await other.respond(
+            opener, self.name, priority=priority, use_cache=False
+        )
 
-            return npc_response
+        self.memory.add("user", "*is nearby*", speaker=other.name)
+        self.memory.add("assistant", opener)
+        self.memory.add("user", reply, speaker=other.name)
+        other.memory.add("user", opener, speaker=self.name)
+        other.memory.add("assistant", reply)
 
-        except Exception as e:
-            return f"*{self.name} seems distracted and doesn't respond properly* (Error: {e})"
+        return f'{self.name}: "{opener}"\n{other.name}: "{reply}"'
 
 
 class GameWorld:
-    def __init__(self):
-        self.locations = {
-            "tavern": {
-                "description": "A cozy tavern with a crackling fireplace. The smell of ale and roasted meat fills the air.",
-                "exits": {"outside": "town_square", "upstairs": "tavern_rooms"},
-                "npcs": [],
-            },
-            "town_square": {
-                "description": "The bustling town square. Market stalls line the edges and townsfolk go about their business.",
-                "exits": {"tavern": "tavern", "north": "castle_gates"},
-                "npcs": [],
-            },
-            "tavern_rooms": {
-                "description": "The upper floor of the tavern. Several doors lead to guest rooms.",
-                "exits": {"downstairs": "tavern"},
-                "npcs": [],
-            },
-            "castle_gates": {
-                "description": "Massive iron gates stand before you, guarded by stern-looking soldiers.",
-                "exits": {"south": "town_square"},
-                "npcs": [],
-            },
-        }
-
-        self.current_location = "tavern"
-        self.npcs = {}
+    """Play state on top of a shared WorldDef.
+
+    NPC objects (with their memory and prompt) are created the first time
+    the player enters their location, so a large map costs nothing until it
+    is explored. `npcs` only holds the NPCs created so far.
+    """
+
+    def __init__(
+        self,
+        definition: Optional[WorldDef] = None,
+        on_spawn: Optional[Callable[[str, NPC], None]] = None,
+    ):
+        self.definition = definition or load_world()
+        self.locations = self.definition.locations
+        self.current_location = self.definition.start
+        self.npcs: Dict[str, NPC] = {}
         self.player_name = "Traveler"
+        self.player_id = uuid.uuid4().hex  # Scopes cached replies to this save
+        self.overheard = {}  # Recent ambient exchanges per location
+        self.journal: Optional[Callable[[Dict], None]] = None  # Set when saved
+        self.on_spawn = on_spawn
+
+        self.spawn(self.current_location)
+
+    def spawn(self, location: str) -> List[NPC]:
+        """Create the NPCs of a location that don't exist yet"""
+        spawned = []
+        for npc_id in self.definition.npcs_at(location):
+            if npc_id not in self.npcs:
+                data = self.definition.npcs[npc_id]
+                npc = NPC(
+                    data.name,
+                    data.role,
+                    data.personality,
+                    data.location,
+                    model=data.extra.get("model"),
+                )
+                self.npcs[npc_id] = npc
+                spawned.append(npc)
+                if self.on_spawn is not None:
+                    self.on_spawn(npc_id, npc)
+        return spawned
+
+    def npcs_here(self) -> List[str]:
+        return self.definition.npcs_at(self.current_location)
+
+    def npc_groups(self) -> List[List[str]]:
+        """Spawned NPC ids grouped by location, for ambient chatter"""
+        groups: Dict[str, List[str]] = {}
+        for npc_id, npc in self.npcs.items():
+            groups.setdefault(npc.location, []).append(npc_id)
+        return list(groups.values())
+
+    def overhear(self, location: str, exchange: str):
+        """Remember the latest ambient exchanges so the player can overhear them"""
+        self.overheard.setdefault(location, deque(maxlen=3)).append(exchange)
+        self.record({"overheard": [location, exchange]})
+
+    def rename_player(self, name: str):
+        self.player_name = name
+        self.record({"set": {"player_name": name}})
+
+    def record(self, event: Dict):
+        if self.journal is not None:
+            self.journal(event)
+
+    def state(self) -> Dict:
+        """Saved form of everything that changes during play"""
+        return {
+            "current_location": self.current_location,
+            "player_name": self.player_name,
+            "player_id": self.player_id,
+            "overheard": {loc: list(lines) for loc, lines in self.overheard.items()},
+        }
 
-        # Create our first NPC
-        self.create_npc()
-
-    def create_npc(self):
-        """Create the tavern keeper NPC"""
-        tavern_keeper = NPC(
-            name="Gareth",
-            role="tavern keeper",
-            personality="friendly but gossipy, loves to share local rumors and stories, has a good memory for faces",
-            location="tavern",
-        )
+    def restore(self, state: Dict):
+        if state.get("current_location") in self.locations:
+            self.current_location = state["current_location"]
+        self.player_name = state.get("player_name", self.player_name)
+        self.player_id = state.get("player_id", self.player_id)
+        self.spawn(self.current_location)
+        self.overheard = {
+            loc: deque(lines, maxlen=3)
+            for loc, lines in state.get("overheard", {}).items()
+        }
 
-        # Add NPC to the world
-        self.npcs["gareth"] = tavern_keeper
-        self.locations["tavern"]["npcs"].append("gareth")
+    def apply(self, event: Dict):
+        """Replay one journal entry"""
+        for name, value in event.get("set", {}).items():
+            if name in ("current_location", "player_name"):
+                setattr(self, name, value)
+        self.spawn(self.current_location)
+        if "overheard" in event:
+            location, exchange = event["overheard"]
+            self.overheard.setdefault(location, deque(maxlen=3)).append(exchange)
 
     def get_location_description(self) -> str:
         """Get the current location's description including NPCs"""
-        loc = self.locations[self.current_location]
-        desc = loc["description"]
+        return self.describe(self.current_location)
+
+    def describe(self, location: str) -> str:
+        """Describe any location; server sessions each stand somewhere else"""
+        loc = self.locations[location]
+        desc = loc.description
 
-        if loc["npcs"]:
+        if loc.npcs:
             desc += "\n\nPeople here:"
-            for npc_id in loc["npcs"]:
+            for npc_id in loc.npcs:
                 npc = self.npcs[npc_id]
                 desc += f"\n- {npc.name} ({npc.role})"
 
+        # Show what the locals have been saying
+        if self.overheard.get(location):
+            desc += f"\n\nYou overhear:\n{self.overheard[location][-1]}"
+
         # Show available exits
         desc += "\n\nExits:"
-        for direction, destination in loc["exits"].items():
+        for direction, destination in loc.exits.items():
             desc += f"\n- {direction}"
 
         return desc
 
+    def exit(self, location: str, direction: str) -> Optional[str]:
+        """Where a direction leads from a location, spawning its NPCs"""
+        target = self.locations[location].exits.get(direction.lower())
+        if target is not None:
+            self.spawn(target)
+        return target
+
     def move(self, direction: str) -> tuple[bool, str]:
         """Attempt to move in a direction"""
-        current = self.locations[self.current_location]
-
-        if direction.lower() in current["exits"]:
-            self.current_location = current["exits"][direction.lower()]
-            return True, self.get_location_description()
-        else:
+        target = self.exit(self.current_location, direction)
+        if target is None:
             return False, "You can't go that way."
 
-    def get_npc_in_location(self, npc_name: str) -> Optional[NPC]:
-        """Get an NPC if they're in the current location"""
-        current_npcs = self.locations[self.current_location]["npcs"]
-
-        for npc_id in current_npcs:
-            npc = self.npcs[npc_id]
-            if npc.name.lower() == npc_name.lower():
-                return npc
+        self.current_location = target
+        self.record({"set": {"current_location": self.current_location}})
+        return True, self.get_location_description()
+
+    def find_place(self, query: str) -> Optional[str]:
+        """Location id for a location's id or name, or for an NPC's name"""
+        query = query.lower().strip()
+        for loc_id, loc in self.locations.items():
+            if query in (loc_id, loc.name.lower()):
+                return loc_id
+        npc_id = self.definition.names.get(query)
+        return self.definition.npcs[npc_id].location if npc_id else None
+
+    def directions(self, location: str, query: str) -> str:
+        """How to get from a location to a place or person, in words"""
+        goal = self.find_place(query)
+        if goal is None:
+            return f"Nobody here has heard of '{query}'."
+        name = self.locations[goal].name
+        steps = self.definition.nav.route(location, goal)
+        if steps is None:
+            return f"There's no way to {name} from here."
+        if not steps:
+            return f"You're already at {name}."
+        moves = ", then ".join(f"'{direction}'" for direction, _ in steps)
+        return f"To reach {name}: go {moves}."
+
+    def get_npc_in_location(
+        self, npc_name: str, location: Optional[str] = None
+    ) -> Optional[NPC]:
+        """Get an NPC if they're in the current (or the given) location"""
+        npc_id = self.definition.names.get(npc_name.lower())
+        if npc_id in self.definition.npcs_at(location or self.current_location):
+            return self.npcs[npc_id]
 
         return None
 
 
+GREETING = "*walks up to you*"
+SAVE_PATH = os.environ.get("NPC_SAVE_PATH", os.path.join("saves", "world"))
+
+
 class Game:
-    def __init__(self):
-        self.world = GameWorld()
+    def __init__(
+        self, save_path: Optional[str] = SAVE_PATH, world: Optional[WorldDef] = None
+    ):
         self.running = True
+        self.console = AsyncInput()
+        self.prefetcher = Prefetcher()
+        self.ambient = AmbientScheduler()
+
+        # Restore the world now; each NPC's memory is read when first needed
+        self.saves = SaveStore(save_path).open() if save_path else None
+        self.world = GameWorld(world, on_spawn=self.bind_npc)
+        if self.saves is not None:
+            self.saves.bind("world", self.world)
+
+    def bind_npc(self, npc_id: str, npc: NPC):
+        if self.saves is not None:
+            self.saves.bind(f"npc:{npc_id}", npc.memory, lazy=True)
+            self.saves.bind(f"episodes:{npc_id}", npc.episodes, lazy=True)
+
+    def prefetch_greetings(self):
+        """Start greetings for everyone here; cancel those left behind"""
+        here = self.world.npcs_here()
+        self.prefetcher.cancel_all(keep=here)
+        for npc_id in here:
+            npc = self.world.npcs[npc_id]
+            self.prefetcher.start(
+                npc_id,
+                lambda: npc.respond(
+                    GREETING,
+                    self.world.player_name,
+                    priority=PREFETCH,
+                    player_id=self.world.player_id,
+                ),
+            )
 
     def show_help(self):
         """Display available commands"""
@@ -153,6 +416,7 @@ class Game:
         print("- look: Describe current location")
         print("- go [direction]: Move in a direction")
         print("- talk [npc name]: Talk to an NPC")
+        print("- directions [place or person]: Ask the way")
         print("- name [your name]: Set your character name")
         print("- quit: Exit game")
         print("- help: Show this help")
@@ -165,12 +429,25 @@ class Game:
         print("\nYou find yourself in a medieval fantasy town...")
         print("\n" + self.world.get_location_description())
 
+        # Load the models and prepare greetings while the player reads
+        for model in get_router().models():
+            self.prefetcher.llm.submit(self.prefetcher.llm.warm(model))
+        self.prefetch_greetings()
+
         self.show_help()
 
+        # NPCs chat among themselves in the background
+        stop_ambient = asyncio.Event()
+        ambient = asyncio.create_task(self.ambient.run(self.world, stop_ambient))
+
         while self.running:
             try:
-                # Get player input
-                user_input = input("\n> ").strip().lower()
+                # Get player input; NPCs keep working while we wait
+                line = await self.console.readline("\n> ")
+                if line is None:
+                    self.running = False  # stdin closed
+                    continue
+                user_input = line.strip().lower()
 
                 if not user_input:
                     continue
@@ -195,9 +472,20 @@ class Game:
                     if args:
                         success, message = self.world.move(args)
                         print(f"\n{message}")
+                        if success:
+                            self.prefetch_greetings()
                     else:
                         print("Go where? (e.g., 'go outside')")
 
+                elif command == "directions":
+                    if args:
+                        print(
+                            "\n"
+                            + self.world.directions(self.world.current_location, args)
+                        )
+                    else:
+                        print("Directions to where? (e.g., 'directions market')")
+
                 elif command == "talk":
                     if args:
                         npc = self.world.get_npc_in_location(args)
@@ -211,8 +499,12 @@ class Game:
 
                 elif command == "name":
                     if args:
-                        self.world.player_name = args.title()
+                        self.world.rename_player(args.title())
                         print(f"You are now known as {self.world.player_name}")
+
+                        # Prefetched greetings addressed the old name
+                        self.prefetcher.cancel_all()
+                        self.prefetch_greetings()
                     else:
                         print(f"Your name is {self.world.player_name}")
 
@@ -224,29 +516,82 @@ class Game:
             except Exception as e:
                 print(f"Error: {e}")
 
+        # Don't wait for an exchange in flight; it can take a while
+        ambient.cancel()
+        try:
+            await ambient
+        except asyncio.CancelledError:
+            pass
+        if self.saves is not None:
+            self.saves.save()
+            self.saves.close()
+
     async def conversation_loop(self, npc: NPC):
         """Handle conversation with an NPC"""
         print(f"\n[Talking to {npc.name}. Type 'bye' to end conversation]")
 
-        # Greeting
-        greeting = await npc.talk("*walks up to you*", self.world.player_name)
-        print(f"\n{npc.name}: {greeting}")
+        npc_id = next(k for k, v in self.world.npcs.items() if v is npc)
+        self.ambient.busy.add(npc_id)
+        try:
+            await self.talk_to(npc, npc_id)
+        finally:
+            self.ambient.busy.discard(npc_id)
+
+        # Fold a long journal into a fresh snapshot between conversations
+        if self.saves is not None:
+            self.saves.save(force=False)
+
+    async def talk_to(self, npc: NPC, npc_id: str):
+        # Greeting, prefetched when the player entered the location. A
+        # prefetch that failed or was preempted is a miss: ask live instead
+        future = self.prefetcher.claim(npc_id)
+        if future is not None:
+            await asyncio.wait([asyncio.wrap_future(future)])
+        greeting = Prefetcher.result(future)
+        await self.say(npc, GREETING, reply=greeting)
 
         while True:
-            user_input = input(f"\n{self.world.player_name}: ").strip()
+            line = await self.console.readline(f"\n{self.world.player_name}: ")
+            if line is None:
+                self.running = False
+                break
+            user_input = line.strip()
 
             if user_input.lower() in ["bye", "goodbye", "farewell"]:
-                farewell = await npc.talk("goodbye", self.world.player_name)
-                print(f"\n{npc.name}: {farewell}")
+                await self.say(npc, "goodbye")
                 break
 
             if user_input:
-                response = await npc.talk(user_input, self.world.player_name)
-                print(f"\n{npc.name}: {response}")
+                await self.say(npc, user_input)
+
+    async def say(
+        self, npc: NPC, player_input: str, reply: Optional[str] = None
+    ) -> str:
+        """Send player input to an NPC and print the reply as it streams in"""
+        streamed = []
+
+        def show(chunk: str):
+            streamed.append(chunk)
+            print(chunk, end="", flush=True)
+
+        print(f"\n{npc.name}: ", end="", flush=True)
+        response = await npc.talk(
+            player_input,
+            self.world.player_name,
+            on_token=show,
+            reply=reply,
+            player_id=self.world.player_id,
+        )
+
+        # Errors come back as a plain message without streaming
+        print("" if streamed else response)
+        return response
 
 
 async def main():
     """Run the game"""
+    # LOG_LEVEL=INFO shows which model answered each turn
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "WARNING").upper())
     game = Game()
     await game.game_loop()
 
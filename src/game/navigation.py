@@ -0,0 +1,186 @@
+## navigation over location exits
+from array import array
+from collections import OrderedDict, deque
+from typing import Dict, List, Mapping, Optional, Tuple
+
+UNREACHABLE = -1
+
+# Per destination: hops to it and the next location on the way, by node index
+Table = Tuple[array, array]
+
+
+class NavGraph:
+    """Location exits compiled into an indexed graph with cached routes.
+
+    Routes are answered from next-hop tables, one per destination, each
+    built by a single breadth-first search backwards from it and kept in
+    an LRU of `max_tables`. After that, the next step from anywhere to
+    that destination is two list lookups, so NPC movement and directions
+    stay O(1) on worlds with thousands of locations without paying for
+    all pairs up front.
+
+    When a location's exits change, update() recompiles just that node and
+    only touches the tables the change can affect: a removed exit matters
+    to tables that route through it, a new exit to tables it makes
+    shorter. Where nothing else routes through the node the table is fixed
+    in place; otherwise it is dropped and rebuilt on next use.
+    """
+
+    def __init__(self, locations: Mapping, max_tables: int = 256):
+        self.locations = locations  # id -> object with an `exits` dict
+        self.max_tables = max_tables
+        self.ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.edges: List[Dict[int, str]] = []  # next node -> direction
+        self.incoming: List[List[int]] = []
+        self.tables: "OrderedDict[int, Table]" = OrderedDict()
+        self.builds = 0
+        for loc_id in locations:
+            self._node(loc_id)
+        for node in range(len(self.ids)):
+            self._compile(node)
+
+    def _node(self, loc_id: str) -> int:
+        node = self.index.get(loc_id)
+        if node is None:
+            node = self.index[loc_id] = len(self.ids)
+            self.ids.append(loc_id)
+            self.edges.append({})
+            self.incoming.append([])
+        return node
+
+    def _compile(self, node: int) -> Tuple[List[int], List[int]]:
+        """Rebuild one node's edges from its exits; returns (added, removed)"""
+        edges: Dict[int, str] = {}
+        for direction, target in self.locations[self.ids[node]].exits.items():
+            target = self._node(target)
+            if target != node:  # An exit back into the same place goes nowhere
+                edges.setdefault(target, direction)
+        old = self.edges[node]
+        added = [n for n in edges if n not in old]
+        removed = [n for n in old if n not in edges]
+        for target in added:
+            self.incoming[target].append(node)
+        for target in removed:
+            self.incoming[target].remove(node)
+        self.edges[node] = edges
+        return added, removed
+
+    def update(self, loc_id: str) -> int:
+        """Exits of a location changed (or it is new); returns how many
+        cached tables were dropped"""
+        node = self._node(loc_id)
+        added, removed = self._compile(node)
+        stale = []
+        for dest, (dist, nxt) in self.tables.items():
+            # New locations start out unreachable until their exits say otherwise
+            missing = len(self.ids) - len(dist)
+            if missing:
+                dist.extend(array("i", [UNREACHABLE]) * missing)
+                nxt.extend(array("i", [UNREACHABLE]) * missing)
+            affected = nxt[node] in removed or any(
+                dist[target] != UNREACHABLE
+                and (dist[node] == UNREACHABLE or dist[target] + 1 < dist[node])
+                for target in added
+            )
+            if affected and not self._repair(dist, nxt, node):
+                stale.append(dest)
+        for dest in stale:
+            del self.tables[dest]
+        return len(stale)
+
+    def _repair(self, dist: array, nxt: array, node: int) -> bool:
+        """Fix one node's entry in place; False if other entries depend on it.
+
+        Safe when no neighbour routes through the node (so no other
+        distance was built on it) and its new distance shortens nobody
+        else's route.
+        """
+        if dist[node] == 0:
+            return True  # The destination itself
+        best, step = UNREACHABLE, UNREACHABLE
+        for target in self.edges[node]:
+            if target == node:
+                continue  # Its own stale distance says nothing
+            hops = dist[target]
+            if hops != UNREACHABLE and (best == UNREACHABLE or hops + 1 < best):
+                best, step = hops + 1, target
+        for prev in self.incoming[node]:
+            if nxt[prev] == node:
+                if best != dist[node]:
+                    return False
+            elif best != UNREACHABLE and (
+                dist[prev] == UNREACHABLE or best + 1 < dist[prev]
+            ):
+                return False
+        dist[node], nxt[node] = best, step
+        return True
+
+    def table(self, dest: int) -> Table:
+        """Next-hop table toward dest, from the cache or one reverse BFS"""
+        table = self.tables.get(dest)
+        if table is not None:
+            self.tables.move_to_end(dest)
+            return table
+
+        size = len(self.ids)
+        dist = array("i", [UNREACHABLE]) * size
+        nxt = array("i", [UNREACHABLE]) * size
+        dist[dest] = 0
+        queue = deque([dest])
+        while queue:
+            node = queue.popleft()
+            for prev in self.incoming[node]:
+                if dist[prev] == UNREACHABLE:
+                    dist[prev] = dist[node] + 1
+                    nxt[prev] = node
+                    queue.append(prev)
+
+        self.builds += 1
+        self.tables[dest] = table = (dist, nxt)
+        if len(self.tables) > self.max_tables:
+            self.tables.popitem(last=False)
+        return table
+
+    def distance(self, start: str, goal: str) -> Optional[int]:
+        """Number of moves from start to goal, or None if there is no way"""
+        dist, _ = self.table(self.index[goal])
+        hops = dist[self.index[start]]
+        return None if hops == UNREACHABLE else hops
+
+    def next_step(self, start: str, goal: str) -> Optional[Tuple[str, str]]:
+        """(direction, location) of the first move toward goal"""
+        node = self.index[start]
+        _, nxt = self.table(self.index[goal])
+        step = nxt[node]
+        if step == UNREACHABLE:
+            return None
+        return self.edges[node][step], self.ids[step]
+
+    def route(self, start: str, goal: str) -> Optional[List[Tuple[str, str]]]:
+        """Every (direction, location) move from start to goal; [] if already
+        there, None if unreachable"""
+        node, dest = self.index[start], self.index[goal]
+        for attempt in range(2):
+            dist, nxt = self.table(dest)
+            if dist[node] == UNREACHABLE:
+                return None
+            steps = self._walk(nxt, node, dest, dist[node])
+            if steps is not None:
+                return steps
+            # A cached table went wrong; never loop on it, rebuild instead
+            del self.tables[dest]
+        raise RuntimeError(f"no consistent route from {start!r} to {goal!r}")
+
+    def _walk(
+        self, nxt: array, node: int, dest: int, hops: int
+    ) -> Optional[List[Tuple[str, str]]]:
+        """Follow next hops for at most `hops` moves; None if that falls short"""
+        steps = []
+        while node != dest:
+            step = nxt[node]
+            if len(steps) == hops or step not in self.edges[node]:
+                return None
+            steps.append((self.edges[node][step], self.ids[step]))
+            node = step
+        return steps
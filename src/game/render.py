@@ -0,0 +1,175 @@
+## cached rendering helpers
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+import pygame
+
+DrawFn = Callable[[pygame.Surface], None]
+
+
+class TextCache:
+    """Rendered text surfaces keyed on (font, text, color), LRU-bounded"""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self.surfaces: "OrderedDict[tuple, pygame.Surface]" = OrderedDict()
+
+    def render(self, font: pygame.font.Font, text: str, color) -> pygame.Surface:
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = font.render(text, True, color)
+            self.surfaces[key] = surface
+            if len(self.surfaces) > self.max_entries:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+
+class TextLayout:
+    """Word-wrapped lines of one text for a font and width.
+
+    When the new text extends the old one (a streamed reply, or the player
+    typing) only the last line is re-wrapped, so per-update cost is bounded
+    by a line instead of the whole text.
+    """
+
+    __slots__ = ("font", "width", "text", "words", "lines", "starts")
+
+    def __init__(self, font: pygame.font.Font, width: int):
+        self.font = font
+        self.width = width
+        self.text = ""
+        self.words: List[str] = []
+        self.lines: List[str] = []
+        self.starts: List[int] = []  # index of the first word of each line
+
+    def update(self, text: str) -> List[str]:
+        if text == self.text:
+            return self.lines
+
+        words = text.split()
+        first = 0
+        if self.lines and text.startswith(self.text):
+            # Lines before the last one are complete; re-wrap from there
+            first = self.starts[-1]
+            del self.lines[-1], self.starts[-1]
+        else:
+            self.lines, self.starts = [], []
+
+        self.text, self.words = text, words
+        self._wrap(first)
+        return self.lines
+
+    def _wrap(self, first: int):
+        current_line = ""
+        start = first
+        for index in range(first, len(self.words)):
+            word = self.words[index]
+            test_line = current_line + word + " "
+            if self.font.size(test_line)[0] < self.width:
+                current_line = test_line
+            else:
+                if current_line:
+                    self.lines.append(current_line.strip())
+                    self.starts.append(start)
+                current_line = word + " "
+                start = index
+        if current_line:
+            self.lines.append(current_line.strip())
+            self.starts.append(start)
+
+
+class LayoutCache:
+    """TextLayouts keyed on (text, font, width), LRU-bounded.
+
+    A miss first tries to extend the most recent layout for the same font
+    and width, which is what happens while a reply streams in.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self.layouts: "OrderedDict[tuple, List[str]]" = OrderedDict()
+        self.latest: Dict[tuple, TextLayout] = {}
+
+    def wrap(self, text: str, font: pygame.font.Font, width: int) -> List[str]:
+        key = (text, font, width)
+        lines = self.layouts.get(key)
+        if lines is not None:
+            self.layouts.move_to_end(key)
+            return lines
+
+        layout = self.latest.get((font, width))
+        if layout is None:
+            layout = self.latest[(font, width)] = TextLayout(font, width)
+        lines = list(layout.update(text))
+
+        self.layouts[key] = lines
+        if len(self.layouts) > self.max_entries:
+            self.layouts.popitem(last=False)
+        return lines
+
+
+class Sprite:
+    """A dynamic layer: where it is, what it looks like, and how to draw it"""
+
+    __slots__ = ("rect", "signature", "draw")
+
+    def __init__(self, rect: Optional[pygame.Rect], signature: Hashable, draw: DrawFn):
+        self.rect = rect
+        self.signature = signature
+        self.draw = draw
+
+
+class DirtyRenderer:
+    """Composites dynamic sprites over a cached background, redrawing only
+    the rectangles whose contents changed since the previous frame.
+
+    A sprite is dirty when its rect or signature changes. Each dirty area is
+    restored from the background and every sprite overlapping it is redrawn
+    (in z-order, clipped to the area) so anti-aliased edges are never blended
+    twice.
+    """
+
+    def __init__(self, screen: pygame.Surface, background: pygame.Surface):
+        self.screen = screen
+        self.background = background
+        self.previous: Dict[str, Tuple[Optional[pygame.Rect], Hashable]] = {}
+        self.full_redraw = True
+
+    def set_background(self, background: pygame.Surface):
+        self.background = background
+        self.full_redraw = True
+
+    def render(self, sprites: Dict[str, Sprite]) -> List[pygame.Rect]:
+        """Draw changed areas and return them for pygame.display.update"""
+        if self.full_redraw:
+            dirty = [self.screen.get_rect()]
+            self.full_redraw = False
+        else:
+            dirty = []
+            for name, sprite in sprites.items():
+                before = self.previous.get(name)
+                if before == (sprite.rect, sprite.signature):
+                    continue
+                if before is not None and before[0] is not None:
+                    dirty.append(before[0])
+                if sprite.rect is not None:
+                    dirty.append(sprite.rect)
+            for name, (rect, _) in self.previous.items():
+                if name not in sprites and rect is not None:
+                    dirty.append(rect)
+
+        for area in dirty:
+            self.screen.set_clip(area)
+            self.screen.blit(self.background, area, area)
+            for sprite in sprites.values():
+                if sprite.rect is not None and sprite.rect.colliderect(area):
+                    sprite.draw(self.screen)
+        self.screen.set_clip(None)
+
+        self.previous = {
+            name: (sprite.rect, sprite.signature) for name, sprite in sprites.items()
+        }
+        return dirty
@@ -0,0 +1,199 @@
+## save games: snapshots plus an append-only journal
+import json
+import os
+import struct
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+State = Dict[str, Any]
+Event = Dict[str, Any]
+
+MAGIC = b"VSAV1\n"
+HEADER = struct.Struct("<I")  # Length of the compressed section index
+
+
+class SaveStore:
+    """Compact save format: a binary snapshot plus a per-change journal.
+
+    The snapshot holds one zlib-compressed JSON section per key ("world",
+    "npc:gareth", ...) behind an index of byte offsets, so a section can be
+    read on its own without touching the rest of the file. Every change made
+    during play is appended to the journal as one line, so saving costs
+    O(change); save() folds everything into a new snapshot when the journal
+    has grown.
+
+    Objects are attached with bind(). They provide state() and
+    restore(state), apply(event) to replay journal entries, and receive a
+    `journal` callback to record new ones. A lazily bound object gets a
+    `loader` instead and is only read in when it is first used.
+    """
+
+    def __init__(self, path: str, compact_every: int = 500):
+        self.path = path
+        self.compact_every = compact_every
+        self.generation = 0
+        self.index: Dict[str, Tuple[int, int]] = {}
+        self.events: Dict[str, List[str]] = {}  # Raw journal lines not yet loaded
+        self.bound: Dict[str, Any] = {}
+        self.loaded = set()
+        self.journaled = 0
+        self._body = 0  # Offset of the first section in the snapshot
+        self._journal = None
+        self._lock = threading.RLock()
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.path, "snapshot.bin")
+
+    def journal_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"journal-{generation}.log")
+
+    def open(self) -> "SaveStore":
+        """Read the snapshot index and group journal lines by key"""
+        os.makedirs(self.path, exist_ok=True)
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "rb") as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    raise ValueError(f"{self.snapshot_path} is not a save file")
+                (size,) = HEADER.unpack(f.read(HEADER.size))
+                header = json.loads(zlib.decompress(f.read(size)))
+            self.generation = header["generation"]
+            self.index = {key: tuple(span) for key, span in header["index"].items()}
+            self._body = len(MAGIC) + HEADER.size + size
+
+        path = self.journal_path(self.generation)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    key, sep, event = line.partition("\t")
+                    if not sep or not line.endswith("\n"):
+                        break  # Torn write from a crash; drop the tail
+                    self.events.setdefault(key, []).append(event)
+                    self.journaled += 1
+        self._journal = open(path, "a", encoding="utf-8")
+        return self
+
+    def close(self):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def keys(self) -> List[str]:
+        return sorted(set(self.index) | set(self.events) | set(self.bound))
+
+    def bind(self, key: str, obj, lazy: bool = False):
+        """Attach an object to a key; restores it now, or on first use"""
+        self.bound[key] = obj
+        obj.journal = lambda event: self.record(key, event)
+        if lazy:
+            obj.loader = lambda: self.load_into(key, obj)
+        else:
+            self.load_into(key, obj)
+
+    def load(self, key: str) -> Tuple[Optional[State], List[Event]]:
+        """Saved state for a key and the journal entries recorded after it"""
+        state = None
+        with self._lock:
+            span = self.index.get(key)
+            if span is not None:
+                offset, size = span
+                with open(self.snapshot_path, "rb") as f:
+                    f.seek(self._body + offset)
+                    state = json.loads(zlib.decompress(f.read(size)))
+            lines = self.events.pop(key, [])
+        return state, [json.loads(line) for line in lines]
+
+    def load_into(self, key: str, obj):
+        # Loading here (e.g. from save()) must stop a later lazy load from
+        # replaying the section on top of newer changes
+        if getattr(obj, "loader", None) is not None:
+            obj.loader = None
+        state, events = self.load(key)
+        if state is not None:
+            obj.restore(state)
+        for event in events:
+            obj.apply(event)
+        self.loaded.add(key)
+
+    def record(self, key: str, event: Event):
+        """Append one change to the journal"""
+        line = f"{key}\t{json.dumps(event, separators=(',', ':'))}\n"
+        with self._lock:
+            if self._journal is None:
+                return
+            self._journal.write(line)
+            self._journal.flush()
+            self.journaled += 1
+
+    @property
+    def needs_compaction(self) -> bool:
+        return self.journaled >= self.compact_every
+
+    def save(self, force: bool = True):
+        """Write a new snapshot of every section and start a fresh journal.
+
+        Sections that were never loaded are copied over byte for byte. The
+        new snapshot and journal belong to the next generation, so a crash
+        part-way through leaves the previous pair intact.
+        """
+        if not force and not self.needs_compaction:
+            return
+
+        # Records made while saving must not land in the old journal
+        with self._lock:
+            # Touched sections are re-encoded; untouched ones keep their bytes
+            sections: Dict[str, bytes] = {}
+            carried: List[str] = []
+            old = open(self.snapshot_path, "rb") if self.index else None
+            try:
+                for key in self.keys():
+                    obj = self.bound.get(key)
+                    if obj is not None and (key in self.loaded or key in self.events):
+                        if key not in self.loaded:
+                            self.load_into(key, obj)
+                        data = json.dumps(obj.state(), separators=(",", ":"))
+                        sections[key] = zlib.compress(data.encode("utf-8"))
+                    elif key in self.index:
+                        offset, size = self.index[key]
+                        old.seek(self._body + offset)
+                        sections[key] = old.read(size)
+                    # Unbound keys keep their journal lines until something loads them
+                    carried.extend(
+                        f"{key}\t{line}" for line in self.events.get(key, ())
+                    )
+            finally:
+                if old is not None:
+                    old.close()
+
+            generation = self.generation + 1
+            index, offset = {}, 0
+            for key, blob in sections.items():
+                index[key] = (offset, len(blob))
+                offset += len(blob)
+            header = zlib.compress(
+                json.dumps({"generation": generation, "index": index}).encode("utf-8")
+            )
+
+            with open(self.journal_path(generation), "w", encoding="utf-8") as f:
+                f.writelines(carried)
+            tmp = self.snapshot_path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(MAGIC + HEADER.pack(len(header)) + header)
+                for blob in sections.values():
+                    f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.snapshot_path)
+
+            if self._journal is not None:
+                self._journal.close()
+            old_journal = self.journal_path(self.generation)
+            if os.path.exists(old_journal):
+                os.remove(old_journal)
+            self._journal = open(self.journal_path(generation), "a", encoding="utf-8")
+            self.generation = generation
+            self.index = index
+            self._body = len(MAGIC) + HEADER.size + len(header)
+            self.journaled = len(carried)
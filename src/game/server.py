@@ -0,0 +1,94 @@
+## multiplayer WebSocket server
+"""Many players, one process, one LLM gateway.
+
+    uvicorn src.game.server:app --port 8100
+
+Connect to /ws (or /ws?session=<id> to resume) and send JSON lines of the
+form {"text": "talk gareth"}. The server answers with messages such as
+{"type": "session", "id": ...}, {"type": "text", "text": ...} and, while an
+NPC speaks, {"type": "token", ...} chunks followed by {"type": "reply", ...}.
+
+VILLAGE_SHARED=0 gives every player a private world instead of one shared
+village.
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
+
+from src.game.sessions import SessionManager
+from src.game.world import DEFAULT_WORLD, load_world
+from src.llm.cache import get_cache
+from src.llm.gateway import get_gateway
+from src.perf import get_metrics
+
+manager = SessionManager(
+    load_world(os.environ.get("VILLAGE_WORLD", DEFAULT_WORLD)),
+    shared=os.environ.get("VILLAGE_SHARED", "1") != "0",
+    max_sessions=int(os.environ.get("VILLAGE_MAX_SESSIONS", "10000")),
+)
+metrics = get_metrics()
+metrics.gauge("sessions", lambda: len(manager.sessions))
+metrics.gauge("sessions_connected", lambda: manager.stats()["connected"])
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(manager.run_reaper())]
+    if manager.shared:
+        # Only the shared village is worth the LLM time for background chatter
+        tasks.append(asyncio.create_task(manager.ambient.run(manager.world, stop)))
+    yield
+    stop.set()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    get_gateway().close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.websocket("/ws")
+async def play(websocket: WebSocket, session: Optional[str] = None):
+    await websocket.accept()
+    player = manager.resume(session) or manager.create()
+    if player is None:
+        await websocket.close(code=1013, reason="server is full")
+        return
+
+    player.connected = True
+    await websocket.send_json({"type": "session", "id": player.id, "name": player.name})
+    try:
+        await manager.handle(player, "look", websocket.send_json)
+        while True:
+            message = await websocket.receive_json()
+            text = message.get("text", "") if isinstance(message, dict) else ""
+            with metrics.span("session_command"):
+                if not await manager.handle(player, str(text), websocket.send_json):
+                    break
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(player)
+
+
+@app.get("/stats")
+async def stats():
+    """Sessions, cache hit rates and LLM queue depth"""
+    return {
+        "sessions": manager.stats(),
+        "cache": get_cache().stats(),
+        "llm_queue_depth": metrics.value("llm_queue_depth"),
+    }
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.to_prometheus())
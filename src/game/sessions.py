@@ -0,0 +1,259 @@
+## player sessions for the multiplayer server
+import asyncio
+import secrets
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from src.game.game import GREETING, NPC, GameWorld
+from src.game.world import WorldDef, load_world
+from src.llm.scheduler import AmbientScheduler
+
+Emit = Callable[[Dict], Awaitable[None]]
+
+HELP = (
+    "Commands: look, go [direction], talk [npc name], directions [place or person], "
+    "name [your name], help, quit"
+)
+FAREWELLS = ("bye", "goodbye", "farewell")
+
+
+class Session:
+    """One player: who they are, where they stand and whom they talk to.
+
+    Everything heavy (NPCs, their memories, the gateway and the cache) lives
+    in the world or is process-wide, so an idle session is a handful of
+    slots, a few hundred bytes, and a server can keep thousands around for
+    players to reconnect to.
+    """
+
+    __slots__ = ("id", "name", "location", "talking", "world", "last_seen", "connected")
+
+    def __init__(self, session_id: str, location: str):
+        self.id = session_id
+        self.name = "Traveler"
+        self.location = location
+        self.talking: Optional[str] = None  # NPC id while in a conversation
+        self.world: Optional[GameWorld] = None  # Only with private worlds
+        self.last_seen = time.monotonic()
+        self.connected = False
+
+
+class SessionManager:
+    """Runs player commands against one shared world or a world per player.
+
+    In the shared world every player meets the same NPCs, who remember
+    everyone they talked to and chat among themselves in the background.
+    Private worlds are created on a player's first command and dropped with
+    the session. Either way all NPCs share the process-wide gateway and
+    response cache. Output goes through an `emit` coroutine, so the same
+    code serves WebSockets and the in-process LocalClient.
+    """
+
+    def __init__(
+        self,
+        definition: Optional[WorldDef] = None,
+        shared: bool = True,
+        max_sessions: int = 10000,
+        idle_timeout: float = 3600.0,
+    ):
+        self.definition = definition or load_world()
+        self.shared = shared
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sessions: Dict[str, Session] = {}
+        self.world = GameWorld(self.definition) if shared else None
+        self.ambient = AmbientScheduler()
+        self.talkers: Dict[str, int] = {}  # Players in conversation per NPC
+
+    def create(self) -> Optional[Session]:
+        """A new session, or None when the server is full"""
+        if len(self.sessions) >= self.max_sessions:
+            self.reap()
+            if len(self.sessions) >= self.max_sessions:
+                return None
+        session = Session(secrets.token_urlsafe(12), self.definition.start)
+        self.sessions[session.id] = session
+        return session
+
+    def resume(self, session_id: Optional[str]) -> Optional[Session]:
+        """The session a reconnecting player left behind, if it still exists"""
+        session = self.sessions.get(session_id) if session_id else None
+        if session is not None:
+            session.last_seen = time.monotonic()
+        return session
+
+    def disconnect(self, session: Session):
+        """Keep the session for a later reconnect; conversations end"""
+        session.connected = False
+        self.end_talk(session)
+
+    def close(self, session: Session):
+        self.disconnect(session)
+        self.sessions.pop(session.id, None)
+
+    def reap(self, now: Optional[float] = None) -> int:
+        """Drop disconnected sessions idle for longer than idle_timeout"""
+        now = now or time.monotonic()
+        stale = [
+            s
+            for s in self.sessions.values()
+            if not s.connected and now - s.last_seen > self.idle_timeout
+        ]
+        for session in stale:
+            self.close(session)
+        return len(stale)
+
+    async def run_reaper(self, interval: float = 60.0):
+        while True:
+            await asyncio.sleep(interval)
+            self.reap()
+
+    def world_for(self, session: Session) -> GameWorld:
+        if self.shared:
+            return self.world
+        if session.world is None:
+            session.world = GameWorld(self.definition)
+        return session.world
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self.sessions),
+            "connected": sum(s.connected for s in self.sessions.values()),
+            "talking": sum(self.talkers.values()),
+            "worlds": (
+                1
+                if self.shared
+                else sum(s.world is not None for s in self.sessions.values())
+            ),
+        }
+
+    def start_talk(self, session: Session, npc_id: str):
+        session.talking = npc_id
+        self.talkers[npc_id] = self.talkers.get(npc_id, 0) + 1
+        self.ambient.busy.add(npc_id)
+
+    def end_talk(self, session: Session):
+        npc_id, session.talking = session.talking, None
+        if npc_id is None:
+            return
+        self.talkers[npc_id] -= 1
+        if not self.talkers[npc_id]:
+            del self.talkers[npc_id]
+            self.ambient.busy.discard(npc_id)
+
+    async def handle(self, session: Session, line: str, emit: Emit) -> bool:
+        """Run one line of player input; False once the player quits"""
+        session.last_seen = time.monotonic()
+        world = self.world_for(session)
+        text = line.strip()
+        if not text:
+            return True
+
+        if session.talking is not None:
+            npc = world.npcs[session.talking]
+            if text.lower() in FAREWELLS:
+                await self.say(session, npc, "goodbye", emit)
+                self.end_talk(session)
+                await emit({"type": "text", "text": f"You leave {npc.name}."})
+            else:
+                await self.say(session, npc, text, emit)
+            return True
+
+        command, _, args = text.partition(" ")
+        command, args = command.lower(), args.strip()
+
+        if command == "quit":
+            await emit({"type": "text", "text": "Thanks for playing!"})
+            self.close(session)
+            return False
+
+        elif command == "help":
+            await emit({"type": "text", "text": HELP})
+
+        elif command == "look":
+            await emit({"type": "text", "text": world.describe(session.location)})
+
+        elif command == "go":
+            target = world.exit(session.location, args) if args else None
+            if target is None:
+                await emit({"type": "error", "text": "You can't go that way."})
+            else:
+                session.location = target
+                await emit({"type": "text", "text": world.describe(target)})
+
+        elif command == "directions":
+            text = world.directions(session.location, args) if args else "Where to?"
+            await emit({"type": "text", "text": text})
+
+        elif command == "talk":
+            npc = world.get_npc_in_location(args, session.location) if args else None
+            if npc is None:
+                await emit(
+                    {"type": "error", "text": f"There's no one called '{args}' here."}
+                )
+            else:
+                self.start_talk(session, self.definition.names[npc.name.lower()])
+                await emit({"type": "talk", "npc": npc.name})
+                await self.say(session, npc, GREETING, emit)
+
+        elif command == "name":
+            if args:
+                session.name = args.title()
+            await emit({"type": "text", "text": f"Your name is {session.name}"})
+
+        else:
+            await emit(
+                {
+                    "type": "error",
+                    "text": "I don't understand that command. Type 'help' for options.",
+                }
+            )
+        return True
+
+    async def say(self, session: Session, npc: NPC, text: str, emit: Emit) -> str:
+        """Send a line to an NPC, emitting the reply token by token"""
+        chunks: asyncio.Queue = asyncio.Queue()
+        talk = asyncio.ensure_future(
+            npc.talk(
+                text, session.name, on_token=chunks.put_nowait, player_id=session.id
+            )
+        )
+        talk.add_done_callback(lambda _: chunks.put_nowait(None))
+        try:
+            while (chunk := await chunks.get()) is not None:
+                await emit({"type": "token", "npc": npc.name, "text": chunk})
+        finally:
+            if not talk.done():
+                talk.cancel()  # The player went away mid-reply
+
+        reply = await talk
+        await emit({"type": "reply", "npc": npc.name, "text": reply})
+        return reply
+
+
+class LocalClient:
+    """Plays a session in-process, receiving the same messages a WebSocket
+    client would. For tests and benchmarks; no network involved."""
+
+    def __init__(self, manager: SessionManager, session_id: Optional[str] = None):
+        self.manager = manager
+        session = manager.resume(session_id) or manager.create()
+        if session is None:
+            raise RuntimeError("server is full")
+        session.connected = True
+        self.session = session
+        self.messages: List[Dict] = []
+
+    async def send(self, line: str) -> List[Dict]:
+        """Run a command; returns the messages it produced"""
+        out: List[Dict] = []
+
+        async def emit(message: Dict):
+            out.append(message)
+
+        await self.manager.handle(self.session, line, emit)
+        self.messages.extend(out)
+        return out
+
+    def close(self):
+        self.manager.disconnect(self.session)
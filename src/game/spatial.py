@@ -0,0 +1,122 @@
+## spatial index
+import math
+from typing import Dict, Hashable, Iterator, List, Optional, Set, Tuple
+
+Rect = Tuple[float, float, float, float]  # x, y, width, height
+
+
+class SpatialGrid:
+    """Uniform grid over moving points (NPCs) and fixed rectangles (locations).
+
+    Points are re-bucketed only when they cross a cell boundary, so moving an
+    entity is O(1). Queries only visit the cells they overlap, so hit-testing
+    and location lookup cost depends on what is nearby, not on world size.
+    Rect queries return keys in insertion order, matching the old "first
+    location in the config wins" behaviour.
+    """
+
+    def __init__(self, cell_size: float = 64.0):
+        self.cell_size = cell_size
+        self.points: Dict[Hashable, Tuple[float, float]] = {}
+        self.rects: Dict[Hashable, Rect] = {}
+        self._point_cells: Dict[Tuple[int, int], Set[Hashable]] = {}
+        self._rect_cells: Dict[Tuple[int, int], List[Hashable]] = {}
+        self._rect_order: Dict[Hashable, int] = {}
+        self._inserted = 0
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def _cells_in(self, x0, y0, x1, y1) -> Iterator[Tuple[int, int]]:
+        cx0, cy0 = self._cell(x0, y0)
+        cx1, cy1 = self._cell(x1, y1)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                yield cx, cy
+
+    # Points
+
+    def insert_point(self, key: Hashable, x: float, y: float):
+        if key in self.points:
+            self.move_point(key, x, y)
+            return
+        self.points[key] = (x, y)
+        self._point_cells.setdefault(self._cell(x, y), set()).add(key)
+
+    def move_point(self, key: Hashable, x: float, y: float):
+        """Update a point's position, re-bucketing only if its cell changed"""
+        old = self._cell(*self.points[key])
+        new = self._cell(x, y)
+        self.points[key] = (x, y)
+        if old != new:
+            self._discard(old, key)
+            self._point_cells.setdefault(new, set()).add(key)
+
+    def remove_point(self, key: Hashable):
+        x, y = self.points.pop(key)
+        self._discard(self._cell(x, y), key)
+
+    def _discard(self, cell, key):
+        bucket = self._point_cells[cell]
+        bucket.discard(key)
+        if not bucket:
+            del self._point_cells[cell]
+
+    def query_radius(
+        self, x: float, y: float, radius: float
+    ) -> List[Tuple[Hashable, float]]:
+        """(key, distance) for every point within radius, nearest first"""
+        found = []
+        limit = radius * radius
+        for cell in self._cells_in(x - radius, y - radius, x + radius, y + radius):
+            for key in self._point_cells.get(cell, ()):
+                px, py = self.points[key]
+                d2 = (px - x) ** 2 + (py - y) ** 2
+                if d2 < limit:
+                    found.append((key, math.sqrt(d2)))
+        found.sort(key=lambda item: item[1])
+        return found
+
+    def nearest(self, x: float, y: float, radius: float) -> Optional[Hashable]:
+        found = self.query_radius(x, y, radius)
+        return found[0][0] if found else None
+
+    # Rects
+
+    def insert_rect(self, key: Hashable, rect: Rect):
+        if key in self.rects:
+            self.remove_rect(key)
+        x, y, w, h = rect
+        self.rects[key] = (x, y, w, h)
+        self._rect_order[key] = self._inserted
+        self._inserted += 1
+        for cell in self._cells_in(x, y, x + w, y + h):
+            self._rect_cells.setdefault(cell, []).append(key)
+
+    def remove_rect(self, key: Hashable):
+        x, y, w, h = self.rects.pop(key)
+        del self._rect_order[key]
+        for cell in self._cells_in(x, y, x + w, y + h):
+            self._rect_cells[cell].remove(key)
+            if not self._rect_cells[cell]:
+                del self._rect_cells[cell]
+
+    def query_rect(self, rect: Rect) -> List[Hashable]:
+        """Keys of rects overlapping rect (pygame colliderect rules)"""
+        x, y, w, h = rect
+        hits = set()
+        for cell in self._cells_in(x, y, x + w, y + h):
+            for key in self._rect_cells.get(cell, ()):
+                rx, ry, rw, rh = self.rects[key]
+                if x < rx + rw and rx < x + w and y < ry + rh and ry < y + h:
+                    hits.add(key)
+        return sorted(hits, key=self._rect_order.__getitem__)
+
+    def query_point(self, x: float, y: float) -> Optional[Hashable]:
+        """First rect (in insertion order) containing the point"""
+        hits = []
+        for key in self._rect_cells.get(self._cell(x, y), ()):
+            rx, ry, rw, rh = self.rects[key]
+            if rx <= x < rx + rw and ry <= y < ry + rh:
+                hits.append(key)
+        return min(hits, key=self._rect_order.__getitem__) if hits else None
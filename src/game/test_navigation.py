@@ -0,0 +1,75 @@
+## NavGraph checked against a plain BFS
+import random
+from collections import deque
+from types import SimpleNamespace
+
+from src.game.navigation import NavGraph
+
+
+def bfs(locations, start, goal):
+    """Moves from start to goal by searching the exits directly"""
+    dist = {start: 0}
+    queue = deque([start])
+    while queue:
+        here = queue.popleft()
+        if here == goal:
+            return dist[here]
+        for target in locations[here].exits.values():
+            if target not in dist:
+                dist[target] = dist[here] + 1
+                queue.append(target)
+    return None
+
+
+def check(nav, locations):
+    for start in locations:
+        for goal in locations:
+            expected = bfs(locations, start, goal)
+            assert nav.distance(start, goal) == expected
+            steps = nav.route(start, goal)
+            if expected is None:
+                assert steps is None
+                continue
+            assert len(steps) == expected
+            here = start
+            for direction, target in steps:
+                assert locations[here].exits[direction] == target
+                here = target
+            assert here == goal
+
+
+def test_self_exit_after_removal():
+    locations = {
+        "a": SimpleNamespace(exits={"n": "b", "loop": "a"}),
+        "b": SimpleNamespace(exits={"s": "a"}),
+    }
+    nav = NavGraph(locations)
+    assert nav.distance("a", "b") == 1
+    del locations["a"].exits["n"]
+    nav.update("a")
+    assert nav.distance("a", "b") is None
+    assert nav.route("a", "b") is None
+    check(nav, locations)
+
+
+def test_updates_match_bfs():
+    for seed in range(40):
+        rng = random.Random(seed)
+        names = [f"l{i}" for i in range(12)]
+        locations = {
+            name: SimpleNamespace(
+                exits={f"d{j}": rng.choice(names) for j in range(rng.randrange(3))}
+            )
+            for name in names
+        }
+        nav = NavGraph(locations, max_tables=8)
+        for _ in range(30):
+            for goal in rng.sample(names, 4):
+                nav.table(nav.index[goal])
+            here = locations[rng.choice(names)]
+            if here.exits and rng.random() < 0.5:
+                del here.exits[rng.choice(list(here.exits))]
+            else:
+                here.exits[f"d{rng.randrange(5)}"] = rng.choice(names)
+            nav.update(next(k for k, v in locations.items() if v is here))
+            check(nav, locations)
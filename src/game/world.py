@@ -0,0 +1,168 @@
+## world definitions
+import json
+import os
+import sys
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.game.navigation import NavGraph
+
+DEFAULT_WORLD = os.path.join(os.path.dirname(__file__), "data", "village.json")
+
+NPC_FIELDS = ("name", "role", "personality", "location", "pos", "color")
+
+
+class WorldError(ValueError):
+    """A world file failed validation; lists every problem found"""
+
+
+class LocationDef:
+    __slots__ = ("id", "name", "description", "exits", "rect", "color", "npcs")
+
+    def __init__(self, id: str, data: Dict[str, Any]):
+        self.id = id
+        self.name: str = data.get("name", id.replace("_", " ").title())
+        self.description: str = data.get("description", "")
+        self.exits: Dict[str, str] = data.get("exits", {})
+        self.rect: Optional[Tuple[int, int, int, int]] = _tuple(data.get("rect"))
+        self.color: Optional[Tuple[int, int, int]] = _tuple(data.get("color"))
+        self.npcs: List[str] = []  # Filled in by WorldDef
+
+
+class NPCDef:
+    __slots__ = NPC_FIELDS + ("id", "extra")
+
+    def __init__(self, id: str, data: Dict[str, Any]):
+        self.id = id
+        self.name: str = data["name"]
+        self.role: str = sys.intern(data["role"])  # Shared by many NPCs
+        self.personality: str = data["personality"]
+        self.location: str = sys.intern(data["location"])
+        self.pos: Optional[Tuple[int, int]] = _tuple(data.get("pos"))
+        self.color: Optional[Tuple[int, int, int]] = _tuple(data.get("color"))
+        # Anything else (inventory, mood, ...) is kept as-is
+        self.extra = {k: v for k, v in data.items() if k not in NPC_FIELDS}
+
+
+class WorldDef:
+    """Validated, indexed world data shared by both front ends.
+
+    Only plain definitions live here; NPC objects, their memory and LLM
+    access are created by the game when the player first reaches them.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        errors = validate(data)
+        if errors:
+            raise WorldError("invalid world:\n- " + "\n- ".join(errors))
+
+        self.context: str = data.get("context", "")
+        self.start: str = data.get("start") or next(iter(data["locations"]))
+        self.locations = {
+            loc_id: LocationDef(loc_id, loc)
+            for loc_id, loc in data["locations"].items()
+        }
+        self.npcs = {
+            npc_id: NPCDef(npc_id, npc) for npc_id, npc in data.get("npcs", {}).items()
+        }
+        for npc in self.npcs.values():
+            self.locations[npc.location].npcs.append(npc.id)
+        self.names = {npc.name.lower(): npc.id for npc in self.npcs.values()}
+        self._nav: Optional[NavGraph] = None
+
+    def npcs_at(self, location: str) -> List[str]:
+        loc = self.locations.get(location)
+        return loc.npcs if loc is not None else []
+
+    @property
+    def nav(self) -> NavGraph:
+        """Route lookups between locations, compiled on first use"""
+        if self._nav is None:
+            self._nav = NavGraph(self.locations)
+        return self._nav
+
+    def add_location(self, loc_id: str, data: Dict[str, Any]) -> LocationDef:
+        """Add a location at runtime; its exits must lead somewhere known"""
+        for direction, target in data.get("exits", {}).items():
+            if target not in self.locations and target != loc_id:
+                raise WorldError(
+                    f"{loc_id}: exit '{direction}' leads to unknown '{target}'"
+                )
+        self.locations[loc_id] = location = LocationDef(loc_id, data)
+        if self._nav is not None:
+            self._nav.update(loc_id)
+        return location
+
+    def set_exit(self, location: str, direction: str, target: Optional[str]):
+        """Open (or with target None, close) an exit; cached routes that it
+        affects are recomputed on next use"""
+        if target is not None and target not in self.locations:
+            raise WorldError(
+                f"{location}: exit '{direction}' leads to unknown '{target}'"
+            )
+        exits = self.locations[location].exits
+        if target is None:
+            exits.pop(direction, None)
+        else:
+            exits[direction] = target
+        if self._nav is not None:
+            self._nav.update(location)
+
+
+def validate(data: Dict[str, Any]) -> List[str]:
+    """Every problem with a world file, in one pass"""
+    errors = []
+    locations = data.get("locations")
+    if not isinstance(locations, dict) or not locations:
+        return ["'locations' must be a non-empty object"]
+
+    start = data.get("start")
+    if start is not None and start not in locations:
+        errors.append(f"start location '{start}' does not exist")
+
+    for loc_id, loc in locations.items():
+        for direction, target in loc.get("exits", {}).items():
+            if target not in locations:
+                errors.append(
+                    f"{loc_id}: exit '{direction}' leads to unknown '{target}'"
+                )
+        if "rect" in loc and not _numbers(loc["rect"], 4):
+            errors.append(f"{loc_id}: rect must be [x, y, width, height]")
+        if "color" in loc and not _numbers(loc["color"], 3):
+            errors.append(f"{loc_id}: color must be [r, g, b]")
+
+    names = set()
+    for npc_id, npc in data.get("npcs", {}).items():
+        for field in ("name", "role", "personality", "location"):
+            if not isinstance(npc.get(field), str):
+                errors.append(f"{npc_id}: missing '{field}'")
+        if isinstance(npc.get("location"), str) and npc["location"] not in locations:
+            errors.append(f"{npc_id}: unknown location '{npc['location']}'")
+        if "pos" in npc and not _numbers(npc["pos"], 2):
+            errors.append(f"{npc_id}: pos must be [x, y]")
+        if "color" in npc and not _numbers(npc["color"], 3):
+            errors.append(f"{npc_id}: color must be [r, g, b]")
+        name = str(npc.get("name", "")).lower()
+        if name in names:
+            errors.append(f"{npc_id}: another NPC is already called '{npc['name']}'")
+        names.add(name)
+    return errors
+
+
+@lru_cache(maxsize=8)
+def load_world(path: str = DEFAULT_WORLD) -> WorldDef:
+    """Parse and validate a world file once per process"""
+    with open(path, encoding="utf-8") as f:
+        return WorldDef(json.load(f))
+
+
+def _tuple(value) -> Optional[tuple]:
+    return tuple(value) if value is not None else None
+
+
+def _numbers(value, count: int) -> bool:
+    return (
+        isinstance(value, list)
+        and len(value) == count
+        and all(isinstance(v, (int, float)) for v in value)
+    )
@@ -0,0 +1,223 @@
+## request batching for the /generate server
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+BatchFn = Callable[[List[str]], Awaitable[List[str]]]
+StreamFn = Callable[[str], AsyncIterator[str]]
+
+
+class QueueFull(Exception):
+    """Raised when too many distinct prompts are pending; maps to HTTP 429"""
+
+
+class MicroBatcher:
+    """Collects concurrent prompts into micro-batches.
+
+    A batch is dispatched when it reaches max_batch prompts or max_wait
+    seconds after its first prompt arrived, whichever comes first. Identical
+    prompts already in flight share one generation. At most max_pending
+    distinct prompts may be queued or running; beyond that submit() raises
+    QueueFull so the server can answer 429 instead of queueing forever.
+    """
+
+    def __init__(
+        self,
+        run_batch: BatchFn,
+        max_batch: int = 8,
+        max_wait: float = 0.02,
+        max_pending: int = 64,
+        max_running_batches: int = 2,
+    ):
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.batches = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._running: Optional[asyncio.Semaphore] = None
+        self._max_running = max_running_batches
+        self._worker: Optional[asyncio.Task] = None
+        self._batches: Set[asyncio.Task] = set()  # The loop only holds weak refs
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._running = asyncio.Semaphore(self._max_running)
+        self._worker = asyncio.create_task(self._collect())
+
+    async def stop(self, timeout: float = 10.0):
+        """Stop collecting, give running batches `timeout` seconds to
+        finish, then cancel whatever is left"""
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+        if self._batches:
+            await asyncio.wait(self._batches, timeout=timeout)
+            for task in self._batches:
+                task.cancel()
+            await asyncio.gather(*self._batches, return_exceptions=True)
+        # Prompts that never made it into a batch
+        for future in self.inflight.values():
+            future.cancel()
+        self.inflight.clear()
+
+    @property
+    def pending(self) -> int:
+        return len(self.inflight)
+
+    async def submit(self, prompt: str) -> str:
+        future = self.inflight.get(prompt)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise QueueFull(f"{self.pending} prompts pending")
+            future = asyncio.get_running_loop().create_future()
+            self.inflight[prompt] = future
+            self._queue.put_nowait(prompt)
+
+        # One client going away must not cancel a generation others share
+        return await asyncio.shield(future)
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Keep collecting the next batch while this one runs
+            await self._running.acquire()
+            task = asyncio.create_task(self._execute(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _execute(self, batch: List[str]):
+        self.batches += 1
+        try:
+            results = await self.run_batch(batch)
+        except asyncio.CancelledError:
+            for prompt in batch:
+                future = self.inflight.pop(prompt, None)
+                if future is not None:
+                    future.cancel()
+            raise
+        except Exception as e:
+            for prompt in batch:
+                self._finish(prompt, error=e)
+        else:
+            for prompt, result in zip(batch, results):
+                self._finish(prompt, result=result)
+        finally:
+            self._running.release()
+
+    def _finish(self, prompt: str, result: str = None, error: Exception = None):
+        future = self.inflight.pop(prompt)
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": self.pending,
+            "batches": self.batches,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+        }
+
+
+class SharedStream:
+    """One generation streamed to any number of subscribers.
+
+    Late subscribers first replay the chunks produced so far. When the last
+    subscriber disconnects the generation is cancelled.
+    """
+
+    def __init__(self, source: AsyncIterator[str], on_done: Callable[[], None]):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[Exception] = None
+        self.subscribers = 0
+        self._updated = asyncio.Event()
+        self._on_done = on_done
+        self._task = asyncio.create_task(self._produce(source))
+
+    async def _produce(self, source: AsyncIterator[str]):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+            self._on_done()
+
+    def _notify(self):
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(self.chunks):
+                    yield self.chunks[index]
+                    index += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._updated.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                self._task.cancel()
+
+
+class StreamCoalescer:
+    """Shares in-flight streaming generations between identical prompts"""
+
+    def __init__(self, stream: StreamFn, max_pending: int = 64):
+        self.stream = stream
+        self.max_pending = max_pending
+        self.inflight: Dict[str, SharedStream] = {}
+        self.coalesced = 0
+        self.rejected = 0
+
+    def subscribe(self, prompt: str) -> AsyncIterator[str]:
+        shared = self.inflight.get(prompt)
+        if shared is not None:
+            self.coalesced += 1
+        else:
+            if len(self.inflight) >= self.max_pending:
+                self.rejected += 1
+                raise QueueFull(f"{len(self.inflight)} streams pending")
+            shared = SharedStream(
+                self.stream(prompt), lambda: self.inflight.pop(prompt, None)
+            )
+            self.inflight[prompt] = shared
+        return shared.subscribe()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self.inflight),
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,281 @@
+## NPC response cache
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.llm.gateway import get_gateway, missing_model
+from src.llm.scheduler import PLAYER
+
+# Called as embed(text, priority=...), like LLMGateway.embed
+Embedder = Callable[..., Awaitable[List[float]]]
+
+DEFAULT_PATH = os.path.join(".cache", "npc_responses.sqlite3")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return " ".join(re.sub(r"[^\w\s]", " ", prompt.lower()).split())
+
+
+def is_cacheable(prompt: str) -> bool:
+    """Stage directions and real questions; skip context-dependent 'yes'/'ok'"""
+    stripped = prompt.strip()
+    if stripped.startswith("*") and stripped.endswith("*"):
+        return True
+    return len(normalize_prompt(prompt).split()) >= 3
+
+
+def scope(npc_id: str, player_id: Optional[str] = None) -> str:
+    """Whose replies an entry may be reused for: one NPC talking to one player.
+
+    Replies often address the player by name or build on what they said
+    before, so another player must not be served them verbatim. Key on
+    something stable and unique per player (a session or save id), not on
+    a display name that many players may share.
+    """
+    return f"{npc_id}:{player_id}" if player_id else npc_id
+
+
+class CacheEntry:
+    __slots__ = ("response", "created", "embedding")
+
+    def __init__(self, response: str, created: float, embedding=None):
+        self.response = response
+        self.created = created
+        self.embedding = embedding
+
+
+class ResponseCache:
+    """LRU/TTL cache of NPC replies keyed on (scope, normalized prompt).
+
+    The scope is the NPC plus the player, when one is given. Lookups try
+    an exact match first, then, if an embedder is configured, the most
+    similar cached prompt in the same scope: one matrix-vector product
+    over that scope's vectors, kept as a NumPy matrix and rebuilt only
+    after the scope changes. Embeddings run at the caller's priority, so
+    prefetch and ambient lookups never jump ahead of the player; if the
+    embedding model is missing semantic lookups stop, and after any other
+    embedding error they pause for `retry_after` seconds. Entries
+    are written through to SQLite so they survive restarts.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 6 * 3600,
+        path: Optional[str] = None,
+        embed: Optional[Embedder] = None,
+        similarity: float = 0.92,
+        retry_after: float = 60.0,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embed = embed
+        self.retry_after = retry_after
+        self.embed_paused_until = 0.0  # Monotonic time; set after a failed embed
+        self.similarity = similarity
+        self.entries: "OrderedDict[Tuple[str, str], CacheEntry]" = OrderedDict()
+        # scope -> (keys, unit vectors as rows) for semantic lookups
+        self.matrices: Dict[str, Tuple[List[Tuple[str, str]], np.ndarray]] = {}
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._last_embedding: Tuple[Optional[str], Optional[np.ndarray]] = (None, None)
+        self._db = None
+
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (npc TEXT, prompt TEXT, "
+                "response TEXT, created REAL, embedding TEXT, "
+                "PRIMARY KEY (npc, prompt))"
+            )
+            self._load()
+
+    def _load(self):
+        cutoff = time.time() - self.ttl
+        self._db.execute("DELETE FROM responses WHERE created < ?", (cutoff,))
+        self._db.commit()
+        rows = self._db.execute(
+            "SELECT npc, prompt, response, created, embedding FROM responses "
+            "ORDER BY created DESC LIMIT ?",
+            (self.max_entries,),
+        ).fetchall()
+        for npc, prompt, response, created, embedding in reversed(rows):
+            vector = (
+                np.asarray(json.loads(embedding), dtype=np.float32)
+                if embedding
+                else None
+            )
+            self.entries[(npc, prompt)] = CacheEntry(response, created, vector)
+
+    async def lookup(
+        self,
+        npc_id: str,
+        prompt: str,
+        player_id: Optional[str] = None,
+        priority: int = PLAYER,
+    ) -> Optional[str]:
+        """Return a cached reply for this NPC, player and prompt, or None"""
+        key = (scope(npc_id, player_id), normalize_prompt(prompt))
+        with self._lock:
+            entry = self._get_fresh(key)
+            if entry is not None:
+                self.hits += 1
+                return entry.response
+
+        if self.embed is not None:
+            vector = await self._embed(key[1], priority)
+            if vector is not None:
+                with self._lock:
+                    entry = self._nearest(key[0], vector)
+                    if entry is not None:
+                        self.semantic_hits += 1
+                        return entry.response
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    async def store(
+        self,
+        npc_id: str,
+        prompt: str,
+        response: str,
+        player_id: Optional[str] = None,
+        priority: int = PLAYER,
+    ):
+        """Cache a reply, evicting the least recently used entry if full"""
+        key = (scope(npc_id, player_id), normalize_prompt(prompt))
+        vector = None
+        if self.embed is not None:
+            vector = await self._embed(key[1], priority)
+        entry = CacheEntry(response, time.time(), vector)
+
+        with self._lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            self.matrices.pop(key[0], None)
+            evicted = []
+            while len(self.entries) > self.max_entries:
+                evicted.append(self.entries.popitem(last=False)[0])
+                self.matrices.pop(evicted[-1][0], None)
+                self.evictions += 1
+
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    (
+                        *key,
+                        response,
+                        entry.created,
+                        json.dumps(vector.tolist()) if vector is not None else None,
+                    ),
+                )
+                self._db.executemany(
+                    "DELETE FROM responses WHERE npc = ? AND prompt = ?", evicted
+                )
+                self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters for tuning size, TTL and similarity threshold"""
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (
+                    (self.hits + self.semantic_hits) / lookups if lookups else 0.0
+                ),
+            }
+
+    def _get_fresh(self, key) -> Optional[CacheEntry]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry.created > self.ttl:
+            del self.entries[key]
+            self.matrices.pop(key[0], None)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _matrix(self, scope: str) -> Tuple[List[Tuple[str, str]], np.ndarray]:
+        """Keys and stacked vectors of one scope's entries, built on demand"""
+        index = self.matrices.get(scope)
+        if index is None:
+            keys = [
+                key
+                for key, entry in self.entries.items()
+                if key[0] == scope and entry.embedding is not None
+            ]
+            vectors = [self.entries[key].embedding for key in keys]
+            dims = {len(vector) for vector in vectors}
+            if len(dims) > 1:  # Embedding model changed; keep the newest size
+                dim = len(vectors[-1])
+                keys = [k for k, v in zip(keys, vectors) if len(v) == dim]
+                vectors = [v for v in vectors if len(v) == dim]
+            matrix = np.stack(vectors) if vectors else np.empty((0, 0), np.float32)
+            index = self.matrices[scope] = (keys, matrix)
+        return index
+
+    def _nearest(self, scope: str, vector: np.ndarray) -> Optional[CacheEntry]:
+        keys, matrix = self._matrix(scope)
+        if not keys or matrix.shape[1] != len(vector):
+            return None
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+        return self._get_fresh(keys[best])
+
+    async def _embed(self, text: str, priority: int) -> Optional[np.ndarray]:
+        # A miss is usually followed by a store of the same prompt
+        if self._last_embedding[0] == text:
+            return self._last_embedding[1]
+        if self.embed_paused_until > time.monotonic():
+            return None
+        try:
+            vector = await self.embed(text, priority=priority)
+        except Exception as e:
+            if missing_model(e):
+                # No embedding model installed: exact matches only from now on
+                self.embed = None
+            else:
+                # Server busy or briefly down: exact matches only for a while
+                self.embed_paused_until = time.monotonic() + self.retry_after
+            return None
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        vector = vector / norm if norm else vector
+        self._last_embedding = (text, vector)
+        return vector
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResponseCache:
+    """Return the process-wide response cache, creating it on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                path=os.environ.get("NPC_CACHE_PATH", DEFAULT_PATH),
+                embed=get_gateway().embed,
+            )
+        return _cache
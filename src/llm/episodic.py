@@ -0,0 +1,234 @@
+## long-term NPC memory with vector retrieval
+import base64
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.llm.gateway import LLMGateway, get_gateway, missing_model
+from src.llm.memory import LOAD_LOCK
+from src.llm.scheduler import AMBIENT, PLAYER
+
+DIM = 128  # Stored dimensions; 20k episodes search in well under 1 ms
+
+_projections: Dict[Tuple[int, int], np.ndarray] = {}
+
+
+def projection(source_dim: int, dim: int = DIM) -> np.ndarray:
+    """Fixed random projection from embedding space down to `dim`.
+
+    Seeded, so every NPC and every run maps vectors the same way and saved
+    episodes stay comparable with new queries. Random projections keep
+    cosine similarity roughly intact, which is all ranking needs.
+    """
+    matrix = _projections.get((source_dim, dim))
+    if matrix is None:
+        rng = np.random.default_rng(source_dim)
+        matrix = rng.standard_normal((source_dim, dim), dtype=np.float32)
+        _projections[(source_dim, dim)] = matrix
+    return matrix
+
+
+class VectorIndex:
+    """Unit vectors in one growing float32 matrix.
+
+    Search is a single matrix-vector product and an argpartition, so it
+    is brute force but contiguous and fast for the tens of thousands of
+    vectors one NPC collects.
+    """
+
+    __slots__ = ("vectors", "size", "capacity")
+
+    def __init__(self, capacity: int = 256):
+        self.vectors: Optional[np.ndarray] = None
+        self.size = 0
+        self.capacity = capacity
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, vector: np.ndarray) -> int:
+        if self.vectors is None:
+            self.vectors = np.empty((self.capacity, len(vector)), dtype=np.float32)
+        elif self.size == len(self.vectors):
+            grown = np.empty((2 * self.size, self.vectors.shape[1]), dtype=np.float32)
+            grown[: self.size] = self.vectors
+            self.vectors = grown
+        self.vectors[self.size] = vector
+        self.size += 1
+        return self.size - 1
+
+    def search(
+        self, query: np.ndarray, k: int, limit: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """(row, cosine) of the k best matches among the first `limit` rows"""
+        n = self.size if limit is None else max(0, min(limit, self.size))
+        if n == 0 or k <= 0:
+            return []
+        scores = self.vectors[:n] @ query
+        top = np.argpartition(scores, n - k)[n - k :] if n > k else np.arange(n)
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(int(row), float(scores[row])) for row in top]
+
+
+class EpisodicMemory:
+    """Every exchange an NPC has had, recalled by relevance.
+
+    Exchanges are embedded once, in the background on the gateway loop,
+    and kept in a VectorIndex. Before a reply only the top `k` past
+    exchanges similar to the player's line are put into the prompt, so an
+    NPC can bring up something from hours ago without sending hours of
+    transcript. Without an embedding model it quietly stays empty.
+
+    Saved like ConversationMemory: changes go to `journal`, and `loader`
+    restores a lazily bound memory on first use.
+    """
+
+    __slots__ = (
+        "llm",
+        "k",
+        "min_score",
+        "dim",
+        "texts",
+        "index",
+        "disabled",
+        "_lock",
+        "journal",
+        "loader",
+    )
+
+    def __init__(
+        self,
+        llm: Optional[LLMGateway] = None,
+        k: int = 3,
+        min_score: float = 0.25,
+        dim: int = DIM,
+    ):
+        self.llm = llm
+        self.k = k
+        self.min_score = min_score
+        self.dim = dim
+        self.texts: List[str] = []
+        self.index = VectorIndex()
+        self.disabled = False  # Set when the embedding model is not installed
+        self._lock = threading.Lock()
+        self.journal: Optional[Callable[[Dict], None]] = None
+        self.loader: Optional[Callable[[], None]] = None
+
+    def __len__(self) -> int:
+        self._load()
+        return len(self.index)
+
+    def _load(self):
+        if self.loader is None:
+            return
+        with LOAD_LOCK:
+            loader, self.loader = self.loader, None
+            if loader is not None:
+                loader()
+
+    def vector(self, embedding: List[float]) -> np.ndarray:
+        """Project an embedding to the stored size and normalize it"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        if len(vector) > self.dim:
+            vector = vector @ projection(len(vector), self.dim)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def remember(self, text: str) -> Optional[Future]:
+        """Embed an exchange in the background and add it to the index"""
+        if self.disabled:
+            return None
+        return (self.llm or get_gateway()).submit(self._remember(text))
+
+    async def _remember(self, text: str):
+        try:
+            embedding = await (self.llm or get_gateway()).embed(text, priority=AMBIENT)
+        except Exception as e:
+            # A busy or restarting server only costs this one episode
+            if missing_model(e):
+                self.disabled = True
+            return
+        self.add(text, self.vector(embedding))
+
+    def add(self, text: str, vector: np.ndarray):
+        self._load()
+        with self._lock:
+            self.texts.append(text)
+            self.index.add(vector)
+        if self.journal is not None:
+            self.journal({"episode": text, "vector": _pack(vector)})
+
+    async def recall(
+        self,
+        query: str,
+        k: Optional[int] = None,
+        skip_recent: int = 0,
+        priority: int = PLAYER,
+    ) -> List[str]:
+        """Past exchanges relevant to query, oldest first.
+
+        The newest `skip_recent` episodes are left out; they are usually
+        still in the recent turns of the prompt anyway.
+        """
+        if self.disabled or len(self) <= skip_recent:
+            return []
+        try:
+            embedding = await (self.llm or get_gateway()).embed(
+                query, priority=priority
+            )
+        except Exception as e:
+            if missing_model(e):
+                self.disabled = True
+            return []
+        return self.search(self.vector(embedding), k, skip_recent)
+
+    def search(
+        self, vector: np.ndarray, k: Optional[int] = None, skip_recent: int = 0
+    ) -> List[str]:
+        with self._lock:
+            if self.index.vectors is not None and len(vector) != len(
+                self.index.vectors[0]
+            ):
+                return []  # Embedding model changed since these were stored
+            hits = self.index.search(
+                vector, k or self.k, limit=len(self.index) - skip_recent
+            )
+            rows = sorted(row for row, score in hits if score >= self.min_score)
+            return [self.texts[row] for row in rows]
+
+    def state(self) -> Dict:
+        """Saved form: texts plus the stored vectors as raw float32"""
+        with self._lock:
+            vectors = self.index.vectors
+            size = self.index.size
+            return {
+                "texts": list(self.texts),
+                "vectors": _pack(vectors[:size]) if size else "",
+                "dim": int(vectors.shape[1]) if vectors is not None else 0,
+            }
+
+    def restore(self, state: Dict):
+        texts = state.get("texts", [])
+        vectors = _unpack(state.get("vectors", "")).reshape(-1, state.get("dim") or 1)
+        with self._lock:
+            self.texts, self.index = [], VectorIndex(max(256, len(texts)))
+            for text, vector in zip(texts, vectors):
+                self.texts.append(text)
+                self.index.add(vector)
+
+    def apply(self, event: Dict):
+        """Replay one journal entry"""
+        if "episode" in event:
+            with self._lock:
+                self.texts.append(event["episode"])
+                self.index.add(_unpack(event["vector"]))
+
+
+def _pack(vectors: np.ndarray) -> str:
+    return base64.b64encode(vectors.astype(np.float32).tobytes()).decode("ascii")
+
+
+def _unpack(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32)
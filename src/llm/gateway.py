@@ -0,0 +1,270 @@
+## shared LLM gateway
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Coroutine, Dict, List, Optional
+
+import httpx
+from ollama import AsyncClient, ResponseError
+
+from src.llm.postprocess import ReplyFilter
+from src.llm.scheduler import PLAYER, PriorityLimiter
+from src.perf import get_metrics
+
+DEFAULT_MODEL = "deepseek-r1"
+EMBED_MODEL = "nomic-embed-text"
+
+
+class LLMGateway:
+    """One background asyncio loop and one pooled set of HTTP connections.
+
+    Every NPC and front end sends its LLM traffic through here, so many NPCs
+    share a few keep-alive connections and a priority limiter caps how many
+    requests reach the model server at once, serving the player first.
+    """
+
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        max_connections: int = 4,
+        max_concurrency: int = 4,
+        timeout: float = 60.0,
+        keep_alive: str = "30m",
+        client: Optional[AsyncClient] = None,
+        http: Optional[httpx.AsyncClient] = None,
+    ):
+        self.host = host
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.keep_alive = keep_alive  # Keep the model and its prefix cache loaded
+        self.client = client
+        self.http = http
+        self.limiter: Optional[PriorityLimiter] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the background loop (idempotent)"""
+        with self._lock:
+            if self.loop is not None:
+                return
+
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            thread = threading.Thread(
+                target=self._run_loop,
+                args=(loop, ready),
+                name="llm-gateway",
+                daemon=True,
+            )
+            thread.start()
+            ready.wait()
+            self.loop, self._thread = loop, thread
+
+    def _run_loop(self, loop: asyncio.AbstractEventLoop, ready: threading.Event):
+        asyncio.set_event_loop(loop)
+
+        # Clients are created on the loop that will own their connections
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+        )
+        if self.client is None:
+            self.client = AsyncClient(
+                host=self.host, timeout=self.timeout, limits=limits
+            )
+        if self.http is None:
+            self.http = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+        self.limiter = PriorityLimiter(self.max_concurrency)
+
+        metrics = get_metrics()
+        metrics.gauge("llm_queue_depth", lambda: self.limiter.queued)
+        metrics.gauge("llm_running", lambda: self.limiter.used)
+
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    def close(self):
+        """Close pooled connections and stop the background loop"""
+        with self._lock:
+            loop, thread = self.loop, self._thread
+            self.loop = self._thread = None
+        if loop is None:
+            return
+
+        async def shutdown():
+            await self.http.aclose()
+            await self.client.close()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+        self.client = self.http = None
+
+    def submit(self, coro: Coroutine) -> Future:
+        """Schedule a coroutine on the gateway loop from any thread"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def run(self, coro: Coroutine) -> Any:
+        """Await a coroutine on the gateway loop from any event loop"""
+        self.start()
+        if _running_loop() is self.loop:
+            return await coro
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def _deliver(self, on_token: Optional[Callable[[str], None]]):
+        """Hand streamed chunks back to the caller's event loop, if it has one"""
+        caller = _running_loop()
+        if on_token is None or caller is None or caller is self.loop:
+            return on_token
+        return lambda chunk: caller.call_soon_threadsafe(on_token, chunk)
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = DEFAULT_MODEL,
+        on_token: Optional[Callable[[str], None]] = None,
+        options: Optional[Dict[str, Any]] = None,
+        priority: int = PLAYER,
+        reply_filter: Optional[ReplyFilter] = None,
+    ) -> str:
+        """Chat completion through the shared Ollama client.
+
+        With a reply_filter, reasoning is hidden from on_token and the stream
+        is closed as soon as the filter has enough of the reply.
+        """
+        return await self.run(
+            self._chat(
+                messages,
+                model,
+                self._deliver(on_token),
+                options,
+                priority,
+                reply_filter,
+            )
+        )
+
+    async def _chat(
+        self, messages, model, on_token, options, priority, reply_filter
+    ) -> str:
+        started = time.perf_counter()
+        async with self.limiter.slot(priority):
+            stream = await self.client.chat(
+                model=model,
+                messages=messages,
+                options=options,
+                keep_alive=self.keep_alive,
+                stream=True,
+            )
+            try:
+                return await _consume(
+                    (part["message"]["content"] async for part in stream),
+                    on_token,
+                    reply_filter,
+                    started,
+                )
+            finally:
+                await stream.aclose()
+
+    async def warm(self, model: str = DEFAULT_MODEL):
+        """Load a model into memory ahead of the first real request"""
+        await self.run(self.client.generate(model=model, keep_alive=self.keep_alive))
+
+    async def embed(
+        self, text: str, model: str = EMBED_MODEL, priority: int = PLAYER
+    ) -> List[float]:
+        """Embedding vector for text through the shared Ollama client"""
+        return await self.run(self._embed(text, model, priority))
+
+    async def _embed(self, text, model, priority) -> List[float]:
+        async with self.limiter.slot(priority):
+            response = await self.client.embed(model=model, input=text)
+            return list(response["embeddings"][0])
+
+    async def generate(
+        self,
+        url: str,
+        prompt: str,
+        on_token: Optional[Callable[[str], None]] = None,
+        priority: int = PLAYER,
+        reply_filter: Optional[ReplyFilter] = None,
+        model: Optional[str] = None,
+    ) -> str:
+        """POST a prompt to a /generate endpoint and stream the reply; the
+        server picks its default model unless one is named"""
+        return await self.run(
+            self._generate(
+                url, prompt, self._deliver(on_token), priority, reply_filter, model
+            )
+        )
+
+    async def _generate(
+        self, url, prompt, on_token, priority, reply_filter, model
+    ) -> str:
+        started = time.perf_counter()
+        body = {"prompt": prompt, "stream": True}
+        if model is not None:
+            body["model"] = model
+        async with self.limiter.slot(priority):
+            # Leaving the block early closes the connection, which stops the server
+            async with self.http.stream("POST", url, json=body) as response:
+                response.raise_for_status()
+                return await _consume(
+                    response.aiter_text(), on_token, reply_filter, started
+                )
+
+
+async def _consume(
+    chunks, on_token, reply_filter: Optional[ReplyFilter], started: float
+) -> str:
+    """Read a chunk stream, passing visible text to on_token; stops early
+    once the reply filter is done"""
+    metrics = get_metrics()
+    if reply_filter is None:
+        reply_filter = ReplyFilter(max_words=None)
+    first = True
+    async for chunk in chunks:
+        metrics.count("llm_tokens")
+        visible = reply_filter.feed(chunk) if chunk else ""
+        if visible and first:
+            metrics.observe("llm_first_token", time.perf_counter() - started)
+            first = False
+        if visible and on_token is not None:
+            on_token(visible)
+        if reply_filter.done:
+            break
+    tail = reply_filter.finish()
+    if tail and on_token is not None:
+        on_token(tail)
+    metrics.observe("llm_reply", time.perf_counter() - started)
+    return reply_filter.text
+
+
+def missing_model(error: BaseException) -> bool:
+    """True if Ollama answered that the requested model is not installed"""
+    return isinstance(error, ResponseError) and error.status_code == 404
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """Return the process-wide gateway, creating it on first use"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
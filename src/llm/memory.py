@@ -0,0 +1,220 @@
+## bounded NPC memory
+import asyncio
+import sys
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.llm.gateway import LLMGateway, get_gateway
+from src.llm.postprocess import ReplyFilter
+from src.llm.scheduler import AMBIENT
+
+Turn = Dict[str, str]
+Summarizer = Callable[[str, List[Turn]], Awaitable[str]]
+# What is kept per turn: (role, speaker or None, text), role and speaker interned
+Packed = Tuple[str, Optional[str], str]
+
+# Lazy loads are rare and short; one lock serves every memory
+LOAD_LOCK = threading.RLock()
+
+SUMMARY_PROMPT = """Fold the new conversation turns into the running summary.
+Keep names, promises, facts the player revealed and anything the NPC should remember.
+Reply with the updated summary only, in under {words} words."""
+
+
+def pack(role: str, content: str, speaker: Optional[str] = None) -> Packed:
+    return (sys.intern(role), sys.intern(speaker) if speaker else None, content)
+
+
+def unpack(turn: Packed) -> Turn:
+    role, speaker, text = turn
+    return {"role": role, "content": f"{speaker}: {text}" if speaker else text}
+
+
+def clip_words(text: str, max_words: int) -> str:
+    """Keep the last max_words words, never cutting a word in half"""
+    words = text.split()
+    return " ".join(words[-max_words:])
+
+
+class ConversationMemory:
+    """Fixed-size ring buffer of recent turns plus a rolling summary.
+
+    Turns that fall out of the buffer are folded into the summary on the
+    gateway loop, so talking to an NPC never waits on summarization and the
+    prompt size stays flat no matter how long the session runs.
+
+    Turns are kept as (role, speaker, text) tuples in a plain list (an
+    empty deque alone costs more than the rest of the memory), with the
+    role and the speaker's name interned, so thousands of NPCs share one
+    copy of "assistant" and of each player's name; message dicts are only
+    built for the prompt.
+
+    When saved (see src.game.save) every change is passed to `journal` in
+    the usual message form, and a lazily restored memory calls `loader`
+    once, on first use.
+    """
+
+    __slots__ = (
+        "turns",
+        "max_turns",
+        "summary",
+        "summary_words",
+        "summarize",
+        "llm",
+        "_pending",
+        "_folding",
+        "_lock",
+        "journal",
+        "loader",
+    )
+
+    def __init__(
+        self,
+        max_turns: int = 10,
+        summary_words: int = 120,
+        summarize: Optional[Summarizer] = None,
+        llm: Optional[LLMGateway] = None,
+    ):
+        self.turns: List[Packed] = []  # Oldest first, at most max_turns
+        self.max_turns = max_turns
+        self.summary = ""
+        self.summary_words = summary_words
+        self.summarize = summarize  # None: llm_summary
+        self.llm = llm
+        self._pending: List[Packed] = []
+        self._folding: Optional[Future] = None
+        self._lock = threading.Lock()
+        self.journal: Optional[Callable[[Dict], None]] = None
+        self.loader: Optional[Callable[[], None]] = None
+
+    def __len__(self) -> int:
+        self._load()
+        return len(self.turns)
+
+    def _load(self):
+        if self.loader is None:
+            return
+        with LOAD_LOCK:
+            loader, self.loader = self.loader, None
+            if loader is not None:
+                loader()
+
+    def add(self, role: str, content: str, speaker: Optional[str] = None):
+        """Record a turn, said by `speaker` if given; evicted turns are
+        queued for summarization"""
+        self._load()
+        turn = pack(role, content, speaker)
+        with self._lock:
+            if len(self.turns) >= self.max_turns:
+                self._pending.append(self.turns.pop(0))
+            self.turns.append(turn)
+            idle = self._folding is None or self._folding.done()
+            if self._pending and idle:
+                self._folding = (self.llm or get_gateway()).submit(self._fold())
+        if self.journal is not None:
+            self.journal({"turn": unpack(turn)})
+
+    def messages(self) -> List[Turn]:
+        """Chat messages for the prompt: summary first, then recent turns"""
+        self._load()
+        with self._lock:
+            history = [unpack(turn) for turn in self.turns]
+            summary = self.summary
+        if summary:
+            history.insert(
+                0, {"role": "system", "content": f"Earlier conversation: {summary}"}
+            )
+        return history
+
+    def lines(
+        self, user_label: str = "Player", assistant_label: str = "NPC"
+    ) -> List[str]:
+        """Transcript lines for completion-style prompts, oldest first"""
+        self._load()
+        labels = {"user": user_label, "assistant": assistant_label}
+        with self._lock:
+            lines = [f"Earlier: {self.summary}"] if self.summary else []
+            for turn in self.turns:
+                message = unpack(turn)
+                role = labels.get(message["role"], message["role"])
+                lines.append(f"{role}: {message['content']}")
+        return lines
+
+    def render(self, user_label: str = "Player", assistant_label: str = "NPC") -> str:
+        """Plain-text transcript for completion-style prompts"""
+        return "\n".join(self.lines(user_label, assistant_label))
+
+    async def _fold(self):
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                summary = self.summary
+            if not pending:
+                return
+
+            turns = [unpack(turn) for turn in pending]
+            try:
+                summary = await (self.summarize or self.llm_summary)(summary, turns)
+            except asyncio.CancelledError:
+                # Preempted by the player: fold these turns next time
+                with self._lock:
+                    self._pending[:0] = pending
+                raise
+            except Exception:
+                # Model unavailable: keep the tail of the raw turns instead
+                summary = " ".join(
+                    [summary] + [f"{t['role']}: {t['content']}" for t in turns]
+                )
+
+            with self._lock:
+                self.summary = summary = clip_words(summary, self.summary_words)
+            if self.journal is not None:
+                self.journal({"summary": summary})
+
+    def state(self) -> Dict:
+        """Saved form: summary, recent turns and turns still being folded"""
+        with self._lock:
+            return {
+                "summary": self.summary,
+                "turns": [unpack(turn) for turn in self.turns],
+                "pending": [unpack(turn) for turn in self._pending],
+            }
+
+    def restore(self, state: Dict):
+        with self._lock:
+            self.turns = _packed(state.get("turns", []))[-self.max_turns :]
+            self.summary = state.get("summary", "")
+            self._pending = _packed(state.get("pending", []))
+
+    def apply(self, event: Dict):
+        """Replay one journal entry"""
+        with self._lock:
+            if "turn" in event:
+                self.turns.append(pack(event["turn"]["role"], event["turn"]["content"]))
+                del self.turns[: -self.max_turns]
+            if "summary" in event:
+                self.summary = event["summary"]
+
+    async def llm_summary(self, summary: str, turns: List[Turn]) -> str:
+        """Default summarizer: ask the model to fold turns into the digest"""
+        transcript = "\n".join(f"{t['role']}: {t['content']}" for t in turns)
+        messages = [
+            {
+                "role": "system",
+                "content": SUMMARY_PROMPT.format(words=self.summary_words),
+            },
+            {
+                "role": "user",
+                "content": f"Summary so far: {summary or '(none)'}\n\nNew turns:\n{transcript}",
+            },
+        ]
+        return await (self.llm or get_gateway()).chat(
+            messages,
+            priority=AMBIENT,
+            reply_filter=ReplyFilter(max_words=self.summary_words),
+        )
+
+
+def _packed(turns: List[Turn]) -> List[Packed]:
+    return [pack(turn["role"], turn["content"]) for turn in turns]
@@ -1,14 +1,21 @@
 import asyncio
-from ollama import AsyncClient
+
+from src.llm.cache import get_cache, is_cacheable
+from src.llm.gateway import get_gateway
+from src.llm.memory import ConversationMemory
+from src.llm.postprocess import ReplyFilter
+from src.llm.router import get_router
 
 # Simple game state
-game_state = {"location": "tavern", "npc_memory": [], "player_name": "Traveler"}
+game_state = {
+    "location": "tavern",
+    "npc_memory": ConversationMemory(max_turns=10),
+    "player_name": "Traveler",
+}
 
 
 async def talk_to_npc(player_input):
     """Talk to the tavern keeper"""
-    client = AsyncClient()
-
     # Build the conversation
     messages = [
         {
@@ -19,20 +26,32 @@ Keep responses short (2-3 sentences) unless asked for more.""",
         }
     ]
 
-    # Add memory (last 5 exchanges)
-    for memory in game_state["npc_memory"][-10:]:
-        messages.append(memory)
+    # Add memory (summary plus last 5 exchanges)
+    messages.extend(game_state["npc_memory"].messages())
 
     # Add player input
     messages.append({"role": "user", "content": player_input})
 
     # Get response
-    response = await client.chat(model="deepseek-r1", messages=messages)
-    npc_response = response["message"]["content"]
+    cache = get_cache()
+    npc_response = None
+    if is_cacheable(player_input):
+        npc_response = await cache.lookup("gareth", player_input)
+    if npc_response is None:
+        router = get_router()
+        route = router.route(player_input, "Gareth")
+        npc_response = await router.run(
+            route,
+            lambda model, emit: get_gateway().chat(
+                messages, model=model, reply_filter=ReplyFilter(max_words=80)
+            ),
+        )
+        if is_cacheable(player_input):
+            await cache.store("gareth", player_input, npc_response)
 
     # Save to memory
-    game_state["npc_memory"].append({"role": "user", "content": player_input})
-    game_state["npc_memory"].append({"role": "assistant", "content": npc_response})
+    game_state["npc_memory"].add("user", player_input)
+    game_state["npc_memory"].add("assistant", npc_response)
 
     return npc_response
 
@@ -0,0 +1,120 @@
+## reply post-processing
+import re
+from typing import Optional
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+WORD_END = re.compile(r"\S+")
+SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*(?=\s)")
+
+
+class ReplyFilter:
+    """Streaming clean-up of model output.
+
+    Drops deepseek-r1 <think>...</think> reasoning as it streams (tags may be
+    split across chunks), and cuts the visible reply at max_words words or
+    max_sentences sentences. Once `done` is set the caller should stop
+    reading the stream, which stops the generation.
+    """
+
+    def __init__(
+        self, max_words: Optional[int] = 80, max_sentences: Optional[int] = None
+    ):
+        self.max_words = max_words
+        self.max_sentences = max_sentences
+        self.visible = ""  # Reply text with reasoning removed
+        self.emitted = 0  # How much of visible has been returned by feed()
+        self.done = False
+        self._pending = ""  # Possible partial tag held back from the last chunk
+        self._thinking = False
+
+    @property
+    def text(self) -> str:
+        return self.visible[: self.emitted].strip()
+
+    def feed(self, chunk: str) -> str:
+        """Add a raw chunk; returns the newly visible text (may be empty)"""
+        if self.done:
+            return ""
+
+        data = self._pending + chunk
+        self._pending = ""
+        while data:
+            tag = THINK_CLOSE if self._thinking else THINK_OPEN
+            index = data.find(tag)
+            if index >= 0:
+                if not self._thinking:
+                    self.visible += data[:index]
+                data = data[index + len(tag) :]
+                self._thinking = not self._thinking
+                continue
+
+            # Hold back a tail that could be the start of the tag
+            keep = _partial_suffix(data, tag)
+            if not self._thinking:
+                self.visible += data[: len(data) - keep]
+            self._pending = data[len(data) - keep :] if keep else ""
+            break
+
+        return self._emit()
+
+    def finish(self) -> str:
+        """End of stream: flush anything held back"""
+        if not self.done and not self._thinking:
+            self.visible += self._pending
+        self._pending = ""
+        text = self._emit(final=True)
+        self.done = True
+        return text
+
+    def _emit(self, final: bool = False) -> str:
+        # Reasoning is usually followed by blank lines
+        if not self.visible.strip():
+            self.visible = ""
+            return ""
+        self.visible = self.visible.lstrip() if self.emitted == 0 else self.visible
+
+        cut = self._limit(final)
+        if cut is not None:
+            self.visible = self.visible[: max(cut, self.emitted)]
+            self.done = True
+        new = self.visible[self.emitted :]
+        self.emitted = len(self.visible)
+        return new
+
+    def _limit(self, final: bool) -> Optional[int]:
+        """Index to cut the visible text at, if a limit has been reached"""
+        cuts = []
+        if self.max_words is not None:
+            words = list(WORD_END.finditer(self.visible))
+            # The last word may still be growing unless it is followed by space
+            complete = (
+                len(words) if final or self.visible[-1:].isspace() else len(words) - 1
+            )
+            if complete >= self.max_words:
+                cuts.append(words[self.max_words - 1].end())
+        if self.max_sentences is not None:
+            text = self.visible if not final else self.visible + " "
+            ends = list(SENTENCE_END.finditer(text))
+            if len(ends) >= self.max_sentences:
+                cuts.append(ends[self.max_sentences - 1].end())
+        return min(cuts) if cuts else None
+
+
+def _partial_suffix(data: str, tag: str) -> int:
+    """Length of the longest suffix of data that is a prefix of tag"""
+    for size in range(min(len(tag) - 1, len(data)), 0, -1):
+        if tag.startswith(data[-size:]):
+            return size
+    return 0
+
+
+def clean_reply(
+    text: str, max_words: Optional[int] = 80, max_sentences: Optional[int] = None
+) -> str:
+    """Apply a ReplyFilter to a complete (non-streamed) reply"""
+    reply = ReplyFilter(max_words, max_sentences)
+    reply.feed(text)
+    reply.finish()
+    return reply.text
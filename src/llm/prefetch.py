@@ -0,0 +1,72 @@
+## speculative greeting prefetch
+from concurrent.futures import Future
+from typing import Callable, Coroutine, Dict, Optional
+
+from src.llm.gateway import LLMGateway, get_gateway
+
+Factory = Callable[[], Coroutine]
+
+
+class Prefetcher:
+    """Starts LLM work the player is likely to need and cancels what goes unused.
+
+    Work is keyed (usually by NPC) and runs on the gateway loop. `update`
+    drives it from distances: inside start_radius a prefetch begins, beyond
+    cancel_radius it is cancelled. The gap between the two radii keeps a
+    player walking along the edge from restarting the same request.
+    """
+
+    def __init__(
+        self,
+        llm: Optional[LLMGateway] = None,
+        start_radius: float = 160.0,
+        cancel_radius: float = 220.0,
+    ):
+        self.llm = llm or get_gateway()
+        self.start_radius = start_radius
+        self.cancel_radius = cancel_radius
+        self.futures: Dict[str, Future] = {}
+        self.started = 0
+        self.used = 0
+        self.cancelled = 0
+
+    def update(self, distances: Dict[str, float], factory: Callable[[str], Coroutine]):
+        """Start or cancel prefetches from the player's distance to each key"""
+        for key, distance in distances.items():
+            if distance < self.start_radius:
+                self.start(key, lambda: factory(key))
+            elif distance > self.cancel_radius:
+                self.cancel(key)
+
+    def start(self, key: str, factory: Factory):
+        """Begin prefetching for key unless it is already in flight or done"""
+        if key not in self.futures:
+            self.futures[key] = self.llm.submit(factory())
+            self.started += 1
+
+    def cancel(self, key: str):
+        """Drop a prefetch, stopping the generation if it is still running"""
+        future = self.futures.pop(key, None)
+        if future is not None and future.cancel():
+            self.cancelled += 1
+
+    def cancel_all(self, keep=()):
+        for key in list(self.futures):
+            if key not in keep:
+                self.cancel(key)
+
+    def claim(self, key: str) -> Optional[Future]:
+        """Take ownership of a prefetch so it is no longer cancelled"""
+        future = self.futures.pop(key, None)
+        if future is not None:
+            self.used += 1
+        return future
+
+    @staticmethod
+    def result(future: Optional[Future]) -> Optional[str]:
+        """Result of a finished prefetch, or None if it failed or isn't done"""
+        if future is None or not future.done() or future.cancelled():
+            return None
+        if future.exception() is not None:
+            return None
+        return future.result()
@@ -0,0 +1,113 @@
+## prompt assembly
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+Turn = Dict[str, str]
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """Cheap token estimate (~1.3 tokens per word piece) for budgeting.
+
+    Ollama does not expose its tokenizer, so this over-counts slightly to
+    stay on the safe side of the context window. Cached because history
+    turns are re-counted on every call.
+    """
+    pieces = TOKEN_PATTERN.findall(text)
+    return len(pieces) + len(pieces) // 3
+
+
+@lru_cache(maxsize=None)
+def model_options(context_tokens: int, reply_tokens: int) -> Dict[str, int]:
+    """Ollama options for a budget; one shared dict per budget, never mutated"""
+    return {"num_ctx": context_tokens, "num_predict": reply_tokens}
+
+
+class PromptBuilder:
+    """Builds prompts for one NPC under a fixed token budget.
+
+    The static prefix (world context, personality, role) is assembled and
+    counted once and always sent first and byte-identical, so the model
+    server can reuse its KV cache for it. Dynamic context goes after the
+    history, and history is filled newest-first until the budget runs out.
+    """
+
+    __slots__ = (
+        "prefix",
+        "prefix_tokens",
+        "context_tokens",
+        "reply_tokens",
+        "system_message",
+        "options",
+    )
+
+    def __init__(
+        self,
+        prefix: str,
+        context_tokens: int = 4096,
+        reply_tokens: int = 1024,  # deepseek-r1 reasons before it replies
+    ):
+        self.prefix = prefix
+        self.prefix_tokens = count_tokens(prefix)
+        self.context_tokens = context_tokens
+        self.reply_tokens = reply_tokens
+        self.system_message = {"role": "system", "content": prefix}
+        self.options = model_options(context_tokens, reply_tokens)
+
+    @property
+    def history_budget(self) -> int:
+        return self.context_tokens - self.reply_tokens - self.prefix_tokens
+
+    def fit(self, history: List[str], reserved: int = 0) -> List[str]:
+        """Newest entries that fit in what is left after the reserved tokens"""
+        budget = self.history_budget - reserved
+        kept = []
+        for entry in reversed(history):
+            cost = count_tokens(entry)
+            if cost > budget:
+                break
+            budget -= cost
+            kept.append(entry)
+        kept.reverse()
+        return kept
+
+    def build_messages(
+        self,
+        history: List[Turn],
+        user_message: str,
+        context: Optional[str] = None,
+    ) -> List[Turn]:
+        """Chat messages: static prefix, fitted history, context, user turn"""
+        tail = []
+        if context:
+            tail.append({"role": "system", "content": context})
+        tail.append({"role": "user", "content": user_message})
+        reserved = sum(count_tokens(message["content"]) for message in tail)
+
+        # Summaries are kept in front of the turns they replace
+        pinned = [m for m in history if m["role"] == "system"]
+        turns = [m for m in history if m["role"] != "system"]
+        reserved += sum(count_tokens(message["content"]) for message in pinned)
+        fitted = self.fit([turn["content"] for turn in turns], reserved)
+        turns = turns[len(turns) - len(fitted) :] if fitted else []
+
+        return [self.system_message] + pinned + turns + tail
+
+    def build_text(
+        self,
+        history: List[str],
+        user_message: str,
+        context: Optional[str] = None,
+    ) -> str:
+        """Completion prompt: static prefix, fitted history, context, user turn"""
+        tail = f"{context}\n" if context else ""
+        tail += f"\nPlayer says: {user_message}"
+        fitted = self.fit(history, count_tokens(tail))
+
+        prompt = self.prefix
+        if fitted:
+            prompt += "Previous conversation:\n" + "\n".join(fitted) + "\n"
+        return prompt + tail
@@ -0,0 +1,277 @@
+## tiered model routing
+import logging
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+from src.llm.cache import normalize_prompt
+from src.llm.gateway import DEFAULT_MODEL
+from src.perf import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Pull both (`ollama pull llama3.2`); without the small one, turns meant for
+# it fall back to the large model
+SMALL_MODEL = os.environ.get("NPC_SMALL_MODEL", "llama3.2")
+LARGE_MODEL = os.environ.get("NPC_LARGE_MODEL", DEFAULT_MODEL)
+
+GREETING = "greeting"
+FAREWELL = "farewell"
+EMOTE = "emote"  # Stage directions such as "*walks up to you*"
+SMALL_TALK = "small_talk"
+QUESTION = "question"
+TRIVIAL = (GREETING, FAREWELL, EMOTE, SMALL_TALK)
+
+GREETINGS = {"hi", "hello", "hey", "greetings", "hail", "good", "morning", "evening"}
+FAREWELLS = {"bye", "goodbye", "farewell", "later", "see", "you", "take", "care"}
+# Words that suggest the reply needs actual reasoning
+REASONING_CUES = {
+    "why",
+    "explain",
+    "should",
+    "would",
+    "could",
+    "if",
+    "plan",
+    "help",
+    "quest",
+    "riddle",
+    "compare",
+    "because",
+    "think",
+    "advice",
+    "secret",
+    "history",
+}
+SMALL_TALK_WORDS = 8
+# Asking about something: a wh-word anywhere, or a line opening like
+# "is the gate open" or "can you help"
+WH_WORDS = {"what", "where", "when", "who", "whom", "whose", "which", "why", "how"}
+YES_NO_OPENERS = {
+    "am",
+    "is",
+    "are",
+    "was",
+    "were",
+    "do",
+    "does",
+    "did",
+    "have",
+    "has",
+    "had",
+    "can",
+    "could",
+    "will",
+    "would",
+    "shall",
+    "should",
+    "may",
+    "might",
+    "must",
+}
+# Questions only in form; these stay small talk
+PLEASANTRIES = (
+    "how are you",
+    "how are things",
+    "how do you do",
+    "how goes it",
+    "how have you been",
+    "how is it going",
+    "how s it going",
+    "how s life",
+)
+
+# An override is a model for every turn, or a model per intent
+Override = Union[str, Dict[str, str]]
+TokenCallback = Callable[[str], None]
+
+
+class Route:
+    __slots__ = ("model", "intent", "npc")
+
+    def __init__(self, model: str, intent: str, npc: Optional[str] = None):
+        self.model = model
+        self.intent = intent
+        self.npc = npc
+
+    def __repr__(self):
+        return f"Route({self.model!r}, {self.intent!r}, npc={self.npc!r})"
+
+
+class ModelRouter:
+    """Sends trivial turns to a small, fast model and the rest to the large one.
+
+    Classification is a keyword check on the player's line, microseconds
+    per turn: greetings, farewells, stage directions, pleasantries and
+    short small talk go to `small`; anything phrased as a question (a
+    wh-word, a yes/no opener, a trailing "?") or long enough to need
+    thought goes to `large`.
+    `intent_models` overrides the model for an intent; an NPC's own
+    override (a model, or a model per intent, e.g. from the world file)
+    wins over both. Reply times are tracked per model so the log and
+    stats() can show how much time routing saved.
+
+    A turn whose model fails (not pulled, say) before streaming anything is
+    retried on `large`, and that model is skipped for `retry_after` seconds.
+    """
+
+    def __init__(
+        self,
+        small: str = SMALL_MODEL,
+        large: str = LARGE_MODEL,
+        intent_models: Optional[Dict[str, str]] = None,
+        retry_after: float = 300.0,
+    ):
+        self.small = small
+        self.large = large
+        self.intent_models = dict(intent_models or {})
+        self.retry_after = retry_after
+        self.unavailable: Dict[str, float] = {}  # model -> when to try it again
+        self.routes: Dict[str, int] = {}  # Turns per intent
+        self.latency: Dict[str, List[float]] = {}  # model -> [turns, seconds]
+        self.saved = 0.0
+        self._lock = threading.Lock()
+
+    def classify(self, text: str) -> str:
+        stripped = text.strip()
+        if stripped.startswith("*") and stripped.endswith("*"):
+            return EMOTE
+        words = normalize_prompt(text).split()
+        if not words:
+            return SMALL_TALK
+        if set(words) <= FAREWELLS:
+            return FAREWELL
+        if set(words) <= GREETINGS | {"there", "friend", "sir", "madam"}:
+            return GREETING
+        if len(words) > SMALL_TALK_WORDS or REASONING_CUES.intersection(words):
+            return QUESTION
+        if " ".join(words).startswith(PLEASANTRIES):
+            return SMALL_TALK
+        if (
+            stripped.endswith("?")
+            or WH_WORDS.intersection(words)
+            or words[0] in YES_NO_OPENERS
+        ):
+            return QUESTION
+        return SMALL_TALK
+
+    def route(
+        self, text: str, npc: Optional[str] = None, override: Optional[Override] = None
+    ) -> Route:
+        """Pick the model for one turn"""
+        intent = self.classify(text)
+        if isinstance(override, dict):
+            override = override.get(intent)
+        model = (
+            override
+            or self.intent_models.get(intent)
+            or (self.small if intent in TRIVIAL else self.large)
+        )
+        with self._lock:
+            if self.unavailable.get(model, 0.0) > time.monotonic():
+                model = self.large
+            self.routes[intent] = self.routes.get(intent, 0) + 1
+        get_metrics().count("route_small" if model != self.large else "route_large")
+        logger.debug("route npc=%s intent=%s -> %s", npc, intent, model)
+        return Route(model, intent, npc)
+
+    def models(self) -> List[str]:
+        """Every model routing can pick, e.g. to warm them up front"""
+        return list(
+            dict.fromkeys([self.small, self.large, *self.intent_models.values()])
+        )
+
+    async def run(
+        self,
+        route: Route,
+        request: Callable[[str, Optional[TokenCallback]], Awaitable[str]],
+        on_token: Optional[TokenCallback] = None,
+    ) -> str:
+        """Await request(model, on_token) for a turn and observe it.
+
+        If anything but the large model fails before a chunk reached
+        on_token, mark it unavailable and ask the large one; once the
+        player has seen part of a reply, a retry would only garble it.
+        """
+        emitted = False
+
+        def emit(chunk: str):
+            nonlocal emitted
+            emitted = True
+            on_token(chunk)
+
+        stream = emit if on_token is not None else None
+        started = time.perf_counter()
+        try:
+            reply = await request(route.model, stream)
+        except Exception as e:
+            if route.model == self.large or emitted:
+                raise
+            logger.warning(
+                "%s failed (%s); using %s for %.0fs",
+                route.model,
+                e,
+                self.large,
+                self.retry_after,
+            )
+            with self._lock:
+                self.unavailable[route.model] = time.monotonic() + self.retry_after
+            route = Route(self.large, route.intent, route.npc)
+            started = time.perf_counter()
+            reply = await request(route.model, stream)
+        self.observe(route, time.perf_counter() - started)
+        return reply
+
+    def observe(self, route: Route, seconds: float):
+        """Record a finished LLM reply and log the time saved versus `large`"""
+        with self._lock:
+            turns = self.latency.setdefault(route.model, [0, 0.0])
+            turns[0] += 1
+            turns[1] += seconds
+            large = self.latency.get(self.large)
+            saved = 0.0
+            if route.model != self.large and large and large[0]:
+                saved = max(0.0, large[1] / large[0] - seconds)
+                self.saved += saved
+        logger.info(
+            "%s (%s) answered by %s in %.2fs, saved ~%.2fs",
+            route.npc or "npc",
+            route.intent,
+            route.model,
+            seconds,
+            saved,
+        )
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "routes": dict(self.routes),
+                "mean_reply_s": {
+                    model: round(total / turns, 3)
+                    for model, (turns, total) in self.latency.items()
+                    if turns
+                },
+                "saved_s": round(self.saved, 3),
+            }
+
+
+def parse_models(spec: str) -> Dict[str, str]:
+    """'greeting=llama3.2,question=deepseek-r1' -> {intent: model}"""
+    pairs = (item.split("=", 1) for item in spec.split(",") if "=" in item)
+    return {intent.strip(): model.strip() for intent, model in pairs}
+
+
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> ModelRouter:
+    """Return the process-wide router, configured from the environment"""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter(
+                intent_models=parse_models(os.environ.get("NPC_INTENT_MODELS", ""))
+            )
+        return _router
@@ -0,0 +1,149 @@
+## LLM request priorities and ambient NPC chatter
+import asyncio
+import heapq
+import itertools
+import random
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Lower runs first
+PLAYER = 0
+PREFETCH = 5
+AMBIENT = 10
+
+
+class PriorityLimiter:
+    """Concurrency limit whose waiters are served by priority.
+
+    Replaces a plain semaphore in the gateway. When a higher-priority
+    request has to wait because every slot is busy, one running
+    lower-priority request (ambient chatter, summaries) is cancelled to make
+    room, so the player never queues behind background work.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.active: Dict[asyncio.Task, int] = {}
+        self.preempted = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._cancelling: Set[asyncio.Task] = set()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PLAYER):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority: int = PLAYER):
+        if self.used < self.limit and not self.queued:
+            self.used += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._order), future))
+            self._preempt(priority)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Granted a slot just as we were cancelled: pass it on
+                    self.used -= 1
+                    self._wake()
+                raise
+        self.active[asyncio.current_task()] = priority
+
+    def release(self):
+        task = asyncio.current_task()
+        self.active.pop(task, None)
+        self._cancelling.discard(task)
+        self.used -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.used < self.limit:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue  # Waiter was cancelled
+            self.used += 1
+            future.set_result(None)
+
+    def _preempt(self, priority: int):
+        victims = [
+            task
+            for task, running in self.active.items()
+            if running > priority and task not in self._cancelling
+        ]
+        if victims and self.used >= self.limit:
+            victim = max(victims, key=self.active.__getitem__)
+            self._cancelling.add(victim)
+            victim.cancel()
+            self.preempted += 1
+
+
+class AmbientScheduler:
+    """Lets NPCs that share a location talk to each other in the background.
+
+    Every tick it picks random pairs of idle, co-located NPCs and runs their
+    exchanges concurrently with asyncio.gather at AMBIENT priority. At most
+    `budget` LLM calls are started per tick (two per exchange), so a world
+    with hundreds of NPCs stays lively without starving the player.
+    """
+
+    def __init__(self, budget: int = 4, interval: float = 10.0, seed=None):
+        self.budget = budget
+        self.interval = interval
+        self.busy: Set[str] = set()  # NPCs that must not be disturbed
+        self.exchanges = 0
+        self.failed = 0
+        self._rng = random.Random(seed)
+
+    def pick_pairs(self, groups: Iterable[List[str]]) -> List[Tuple[str, str]]:
+        """Random pairs of idle NPCs from each group, within the budget"""
+        candidates = []
+        for group in groups:
+            idle = [npc_id for npc_id in group if npc_id not in self.busy]
+            self._rng.shuffle(idle)
+            candidates.extend(zip(idle[0::2], idle[1::2]))
+        self._rng.shuffle(candidates)
+        return candidates[: self.budget // 2]
+
+    async def tick(self, world) -> int:
+        """Run one round of ambient exchanges; returns how many completed"""
+        pairs = self.pick_pairs(world.npc_groups())
+        if not pairs:
+            return 0
+
+        results = await asyncio.gather(
+            *(
+                world.npcs[a].chat_with(world.npcs[b], priority=AMBIENT)
+                for a, b in pairs
+            ),
+            return_exceptions=True,
+        )
+
+        completed = 0
+        for (a, b), result in zip(pairs, results):
+            if isinstance(result, BaseException):
+                self.failed += 1
+                continue
+            completed += 1
+            world.overhear(world.npcs[a].location, result)
+        self.exchanges += completed
+        return completed
+
+    async def run(self, world, stop: Optional[asyncio.Event] = None):
+        """Tick forever (or until stop is set)"""
+        stop = stop or asyncio.Event()
+        while not stop.is_set():
+            await self.tick(world)
+            try:
+                await asyncio.wait_for(stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
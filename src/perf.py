@@ -0,0 +1,236 @@
+## hot-path timing and metrics export
+import asyncio
+import bisect
+import functools
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+# Upper bounds in seconds, 0.1 ms to 10 s
+BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.016,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Histogram:
+    """Cumulative buckets for export plus a window of recent samples for
+    percentiles, so a stutter shows up at once instead of being averaged
+    away over the whole session."""
+
+    __slots__ = ("counts", "count", "total", "recent")
+
+    def __init__(self, window: int = 600):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.recent: Deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class Rate:
+    """Events per second over a sliding window"""
+
+    __slots__ = ("window", "events", "total", "_lock")
+
+    def __init__(self, window: float = 5.0):
+        self.window = window
+        self.events: Deque[Tuple[float, float]] = deque()
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, amount: float = 1.0, now: Optional[float] = None):
+        with self._lock:
+            self.events.append((now or time.monotonic(), amount))
+            self.total += amount
+
+    def per_second(self, now: Optional[float] = None) -> float:
+        now = now or time.monotonic()
+        with self._lock:
+            while self.events and self.events[0][0] < now - self.window:
+                self.events.popleft()
+            return sum(amount for _, amount in self.events) / self.window
+
+
+class Metrics:
+    """Named spans, rates and gauges shared by the game loop and the LLM path.
+
+    Recording is a perf_counter call and a deque append, cheap enough for
+    every frame; set `enabled` to False to make spans free.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.histograms: Dict[str, Histogram] = {}
+        self.rates: Dict[str, Rate] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def count(self, name: str, amount: float = 1.0):
+        rate = self.rates.get(name)
+        if rate is None:
+            with self._lock:
+                rate = self.rates.setdefault(name, Rate())
+        rate.add(amount)
+
+    def rate(self, name: str) -> float:
+        rate = self.rates.get(name)
+        return rate.per_second() if rate is not None else 0.0
+
+    def gauge(self, name: str, read: Callable[[], float]):
+        """Register a value that is read at export time"""
+        self.gauges[name] = read
+
+    def value(self, name: str) -> float:
+        read = self.gauges.get(name)
+        return _read(read) if read is not None else 0.0
+
+    def percentiles(self, name: str) -> Dict[str, float]:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+        return {
+            "p50": histogram.percentile(0.5),
+            "p95": histogram.percentile(0.95),
+            "p99": histogram.percentile(0.99),
+        }
+
+    def to_json(self) -> Dict:
+        with self._lock:
+            histograms = dict(self.histograms)
+            rates = dict(self.rates)
+        return {
+            "spans": {
+                name: {
+                    "count": h.count,
+                    "sum": h.total,
+                    **self.percentiles(name),
+                    "buckets": dict(zip([*map(str, BUCKETS), "+Inf"], h.counts)),
+                }
+                for name, h in histograms.items()
+            },
+            "rates": {
+                name: {"per_second": r.per_second(), "total": r.total}
+                for name, r in rates.items()
+            },
+            "gauges": {name: _read(read) for name, read in self.gauges.items()},
+        }
+
+    def to_prometheus(self, prefix: str = "village") -> str:
+        """Prometheus text exposition format"""
+        with self._lock:
+            histograms = dict(self.histograms)
+            rates = dict(self.rates)
+        lines: List[str] = []
+        if histograms:
+            metric = f"{prefix}_span_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+        for name, h in histograms.items():
+            cumulative = 0
+            for bound, count in zip([*map(str, BUCKETS), "+Inf"], h.counts):
+                cumulative += count
+                lines.append(
+                    f'{metric}_bucket{{span="{name}",le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'{metric}_sum{{span="{name}"}} {h.total}')
+            lines.append(f'{metric}_count{{span="{name}"}} {h.count}')
+        for name, r in rates.items():
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {r.total}")
+        for name, read in self.gauges.items():
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {_read(read)}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """Dump to a file: Prometheus text for .prom, JSON otherwise"""
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith(".prom"):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.to_json(), f, indent=2)
+
+
+def _read(read: Callable[[], float]) -> float:
+    try:
+        return float(read())
+    except Exception:
+        return float("nan")
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """Return the process-wide metrics registry"""
+    return _metrics
+
+
+def timed(name: str):
+    """Decorator: record every call of a function (sync or async) as a span"""
+
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with _metrics.span(name):
+                    return await fn(*args, **kwargs)
+
+        else:
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with _metrics.span(name):
+                    return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate